@@ -1,29 +1,364 @@
 import datetime
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas_datareader.data as web
 import pandas as pd
+from pandas_datareader._utils import RemoteDataError
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+"""
+The directory in which get_data keeps a copy of everything it downloads from Yahoo, as one <symbol>.parquet file per
+symbol
+"""
+CACHE_DIR = "cache"
+
+"""
+The number of local files whose contents get_data keeps in memory, so that analyses which read the same symbol more than
+once (MACD_signal, for instance) only read its file once. analyze_symbols reads files ahead of its workers into this
+cache, a few per worker, so it grows with the number of cores.
+"""
+LOCAL_CACHE_SIZE = max(32, 4 * (os.cpu_count() or 1))
+
+"""
+The types that price columns are read as, from .csv's and from Yahoo alike. Prices don't need more than float32's
+precision, and reading them as such halves their memory, and the memory the averages calculated from them have to read.
+"""
+PRICE_DTYPES = {"Close": np.float32, "Adj Close": np.float32}
+
+"""
+The name of the file, within a directory of local data, that prewarm gathers the prices of every symbol into
+"""
+PRICE_STORE = "prices.parquet"
+
+"""
+Yahoo's spark endpoint returns daily closing prices for several symbols in one request, but accepts at most this many
+comma-separated symbols at a time
+"""
+BATCH_SIZE = 20
+SPARK_URL = "https://query1.finance.yahoo.com/v8/finance/spark"
+
+"""
+The ranges accepted by the spark endpoint, each paired with the number of calendar days it reaches back from today
+"""
+SPARK_RANGES = [("1d", 1), ("5d", 5), ("1mo", 31), ("3mo", 92), ("6mo", 183), ("1y", 366), ("2y", 731), ("5y", 1827),
+                ("10y", 3653)]
+
+"""
+The number of spark requests get_data_batch keeps in flight at once, and how many seconds each one may take
+"""
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 10
+
+"""
+How many times get_data tries to download a symbol's data before giving up on it, and how many seconds it waits before
+its first retry. The wait doubles with each retry after that, as with the retries of spark requests.
+"""
+REMOTE_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+
+# analyze_symbols may read from the same store file from several threads at once, and a ParquetFile isn't safe to read
+# from concurrently, so reads from it take turns
+_store_lock = threading.Lock()
 
+# One shared session so that connections to Yahoo are reused between requests. Transient failures (rate limiting,
+# server errors) are retried with a backoff before we give up on a chunk of symbols.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=MAX_WORKERS,
+                                       max_retries=Retry(total=3, backoff_factor=0.5,
+                                                         status_forcelist=[429, 500, 502, 503, 504])))
 
-def get_data(symbol: str, start:datetime.datetime, end: datetime.datetime, local=False, dir=""):
+
+def get_data(symbol: str, start:datetime.datetime, end: datetime.datetime, local=False, dir="",
+             columns: Optional[List[str]] = None):
     """
     Gets data for the given symbol according to the given range, either locally or from Yahoo's finance API.
 
+    If <columns> is given, only those columns (for example, ["Adj Close"]) are returned, along with the "Date" index.
+    When reading a local .csv, the other columns are never even parsed. Price columns are float32; see PRICE_DTYPES.
+
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
+    If both exist, <symbol>.parquet is used. If <dir> has been passed to prewarm, the data for <symbol> is read from
+    the single file prewarm created instead, as long as <symbol> is in it.
 
     Returns none and prints a message if there is an error accessing data.
     """
     if local:
-        try:
-            df = pd.read_csv(f"{dir}/{symbol}.csv", parse_dates=True, index_col=0)
-        except FileNotFoundError:
-            print(f"No file to open for {symbol}")
+        df = _get_local(symbol, dir, None if columns is None else tuple(columns))
+        if df is None:
             return None
-    else:
+        # _get_local is memoized, so hand out a copy that callers are free to modify
+        return df.copy()
+
+    df = _get_remote(symbol, start, end)
+    if df is None:
+        return None
+    if columns is None:
+        # _get_remote is memoized, so hand out a copy that callers are free to modify
+        return df.copy()
+
+    # Yahoo doesn't always return every column, so check before picking them out, rather than raising a KeyError
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        print(f"No {', '.join(missing)} data for {symbol}")
+        return None
+    return df[columns].copy()
+
+
+@functools.lru_cache(maxsize=LOCAL_CACHE_SIZE)
+def _get_local(symbol: str, dir: str, columns: Optional[Tuple[str, ...]]) -> Optional[pd.DataFrame]:
+    """
+    Reads the file holding data for <symbol> in <dir>, as described in get_data. <columns> is a tuple, rather than a
+    list, so that it can be part of the key results are memoized under. The returned DataFrame must not be modified.
+
+    Returns none and prints a message if there is no file for <symbol>.
+    """
+    store = _open_store(dir)
+    if store is not None and symbol in store[1]:
+        file, row_groups = store
+        with _store_lock:
+            df = file.read_row_group(row_groups[symbol], columns=None if columns is None else ["Date", *columns])
+        return df.to_pandas().drop(columns="Symbol", errors="ignore").set_index("Date")
+
+    # Files are memory-mapped rather than read through a buffer, and a .parquet file skips the CSV parser entirely
+    parquet_path = f"{dir}/{symbol}.parquet"
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path, columns=None if columns is None else list(columns), memory_map=True)
+
+    try:
+        return pd.read_csv(f"{dir}/{symbol}.csv", parse_dates=True, index_col=0, memory_map=True, engine="c",
+                           usecols=None if columns is None else ["Date", *columns], dtype=PRICE_DTYPES)
+    except FileNotFoundError:
+        print(f"No file to open for {symbol}")
+        return None
+
+
+def prewarm(dir: str):
+    """
+    Gathers the contents of every .parquet and .csv in <dir>, as saved by tools/pull_data.py, into the single file
+    <dir>/PRICE_STORE, which get_data reads from instead from then on. The file has a "Symbol" column on top of the
+    columns of the symbols' files. As in get_data, a symbol's .parquet is used if it has both.
+
+    Each symbol's rows are written as their own row group, so get_data can read the prices of one symbol without
+    parsing or even touching the rest of the file.
+
+    Prints a message and leaves a symbol out of the file if its file can't be read, or its columns don't match the
+    others'.
+    """
+    path = f"{dir}/{PRICE_STORE}"
+    # Map each symbol to its file, letting a .parquet replace a .csv of the same symbol. The store itself is a .parquet
+    # too, but not one of a symbol.
+    files = {}
+    for name in sorted(os.listdir(dir)):
+        symbol, extension = os.path.splitext(name)
+        if extension == ".parquet" and name != PRICE_STORE or extension == ".csv" and symbol not in files:
+            files[symbol] = name
+
+    writer = None
+    for symbol, name in sorted(files.items()):
+        try:
+            if name.endswith(".parquet"):
+                df = pd.read_parquet(f"{dir}/{name}").reset_index()
+                df = df.astype({column: dtype for column, dtype in PRICE_DTYPES.items() if column in df.columns})
+            else:
+                df = pd.read_csv(f"{dir}/{name}", parse_dates=["Date"], engine="c", dtype=PRICE_DTYPES)
+            if df.empty:
+                continue
+
+            df.insert(0, "Symbol", symbol)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema), row_group_size=len(df))
+        except (ValueError, KeyError, pa.ArrowException) as e:
+            print(f"Couldn't add {symbol} to {path}: {e}")
+
+    if writer is not None:
+        writer.close()
+    # Any copy of the old file that was opened before now is out of date
+    _open_store.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _open_store(dir: str) -> Optional[Tuple[pq.ParquetFile, Dict[str, int]]]:
+    """
+    Opens the file created by prewarm in <dir>, if there is one. Returns the opened file, along with a dict mapping each
+    symbol in it to the index of the row group holding that symbol's rows.
+
+    The file's footer is only parsed once per process, rather than once per symbol read from it.
+    """
+    path = f"{dir}/{PRICE_STORE}"
+    if not os.path.exists(path):
+        return None
+
+    file = pq.ParquetFile(path, memory_map=True)
+    # Each row group holds exactly one symbol, so the smallest value of its "Symbol" column is that symbol
+    symbol_column = file.schema_arrow.get_field_index("Symbol")
+    row_groups = {file.metadata.row_group(i).column(symbol_column).statistics.min: i
+                  for i in range(file.num_row_groups)}
+    return file, row_groups
+
+
+def get_price_matrix(symbols: List[str], start: Optional[datetime.datetime], end: datetime.datetime,
+                     dir: str) -> Optional[pd.DataFrame]:
+    """
+    Gets the "Adj Close" prices of every symbol in <symbols> between <start> and <end>, inclusive, from the file that
+    prewarm created in <dir>, all at once. If <start> is None, gets every price up to <end>. Returns a DataFrame with
+    one float32 row per symbol, indexed by "Symbol", and one column for each trading day in the range on which any of
+    them has a price.
+
+    A symbol's row is np.nan for days before it has any prices. A day missing from a symbol's data after that, such as
+    a day on which it wasn't traded, is given the price from the day before. Symbols that aren't in the file are left
+    out.
+
+    Returns none and prints a message if <dir> has no such file.
+    """
+    path = f"{dir}/{PRICE_STORE}"
+    if not os.path.exists(path):
+        print(f"No {PRICE_STORE} in {dir}. Run prewarm on it first.")
+        return None
+
+    filters = [("Symbol", "in", symbols), ("Date", "<=", pd.Timestamp(end))]
+    if start is not None:
+        filters.append(("Date", ">=", pd.Timestamp(start)))
+    df = pd.read_parquet(path, columns=["Symbol", "Date", "Adj Close"], memory_map=True, filters=filters)
+    # Every symbol's prices end up in one contiguous row, which is the layout the kernels that use them want
+    matrix = df.pivot(index="Symbol", columns="Date", values="Adj Close").ffill(axis=1)
+    return matrix.astype(np.float32)
+
+
+class _RemoteError(Exception):
+    """
+    Raised by _read_remote when data can't be had for a symbol. Raising, rather than returning None, keeps the failure
+    out of _read_remote's memo, so that the symbol is tried again the next time it's asked for.
+    """
+
+
+def _get_remote(symbol: str, start: datetime.datetime, end: datetime.datetime) -> Optional[pd.DataFrame]:
+    """
+    Gets data for the given symbol according to the given range from Yahoo's finance API, as described in _read_remote.
+    The returned DataFrame must not be modified.
+
+    Returns none and prints a message if there is an error accessing data.
+    """
+    try:
+        return _read_remote(symbol, start, end)
+    except _RemoteError as e:
+        print(e)
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _read_remote(symbol: str, start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+    """
+    Gets data for the given symbol according to the given range from Yahoo's finance API, going through the cache in
+    CACHE_DIR. If the cached file for <symbol> already covers <start>-<end> it is sliced and returned without making a
+    request. Otherwise, data is fetched for the union of the cached range and the requested one, and the cached file is
+    rewritten so that it covers both.
+
+    Results are also memoized in-process, so the returned DataFrame must not be modified.
+
+    Raises _RemoteError if there is an error accessing data.
+    """
+    path = f"{CACHE_DIR}/{symbol}.parquet"
+    fetch_start, fetch_end = start, end
+    if os.path.exists(path):
+        cached = pd.read_parquet(path)
+        # The range that was requested when the file was written is stored alongside the data, since the first and
+        # last rows only tell us the first and last TRADING days in that range. Older versions of pandas don't save
+        # it, so a file without one is treated as if it weren't there, and is rewritten with just the requested range.
+        cached_start, cached_end = cached.attrs.get("start"), cached.attrs.get("end")
+        if cached_start is not None and cached_end is not None:
+            cached_start = datetime.datetime.fromisoformat(cached_start)
+            cached_end = datetime.datetime.fromisoformat(cached_end)
+            if cached_start <= start and end <= cached_end:
+                return cached.loc[start:end]
+
+            fetch_start, fetch_end = min(start, cached_start), max(end, cached_end)
+
+    for attempt in range(REMOTE_ATTEMPTS):
         try:
-            df = web.DataReader(symbol, "yahoo", start, end)
+            df = web.DataReader(symbol, "yahoo", fetch_start, fetch_end)
+            break
         except KeyError:
-            print("KeyError getting RSI data for " + symbol)
-            return None
+            raise _RemoteError("KeyError getting RSI data for " + symbol)
+        except (RemoteDataError, requests.RequestException) as e:
+            # Rate limiting and dropped connections are usually over in a moment, so back off and try again rather than
+            # losing the symbol's data to them. Only give up once every attempt has failed.
+            if attempt == REMOTE_ATTEMPTS - 1:
+                raise _RemoteError(f"Error getting data for {symbol}: {e}")
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+    # Downcast the prices as get_data does when reading a .csv, so the cached file is stored as float32 as well
+    df = df.astype({column: dtype for column, dtype in PRICE_DTYPES.items() if column in df.columns})
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    df.attrs["start"] = fetch_start.isoformat()
+    df.attrs["end"] = fetch_end.isoformat()
+    df.to_parquet(path)
+
+    return df.loc[start:end]
+
+
+def get_data_batch(symbols: List[str], start: datetime.datetime, end: datetime.datetime) -> Dict[str, pd.DataFrame]:
+    """
+    Gets daily closing prices for every symbol in <symbols> between <start> and <end>, inclusive, from Yahoo's spark
+    endpoint. Symbols are requested BATCH_SIZE at a time, so this makes roughly len(symbols) / BATCH_SIZE requests
+    instead of one per symbol like get_data does.
+
+    Returns a dict mapping each symbol to a DataFrame with index "Date" and one column, "Close". Symbols that Yahoo has
+    no data for are left out of the dict. Note that, unlike get_data, the spark endpoint doesn't provide "Adj Close".
+    """
+    days_back = (datetime.datetime.today() - start).days + 1
+    spark_range = "max"
+    for name, days in SPARK_RANGES:
+        if days >= days_back:
+            spark_range = name
+            break
+
+    # Each day's close is dated at midnight of that day, below, and compared against <start> exactly as given. A day
+    # only counts if it starts at or after <start>, so the window is never widened to take in the whole of <start>'s
+    # day, and passing a midnight <start> includes that day.
+    start = pd.Timestamp(start)
+
+    chunks = [symbols[i:i + BATCH_SIZE] for i in range(0, len(symbols), BATCH_SIZE)]
+
+    result = {}
+    # The requests are network-bound, so we keep several in flight at once rather than waiting on each in turn
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for response in executor.map(lambda chunk: _get_spark(chunk, spark_range), chunks):
+            for symbol, series in response.items():
+                if not series or not series.get("timestamp"):
+                    continue
+
+                df = pd.DataFrame({"Close": series["close"]},
+                                  index=pd.to_datetime(series["timestamp"], unit="s").normalize().rename("Date"))
+                result[symbol] = df.loc[start:end].dropna()
 
-    return df
\ No newline at end of file
+    return result
+
+
+def _get_spark(symbols: List[str], spark_range: str) -> dict:
+    """
+    Makes one request to Yahoo's spark endpoint for <symbols>, and returns the decoded JSON response.
+
+    Returns an empty dict and prints a message if the request fails.
+    """
+    try:
+        params = {"symbols": ",".join(symbols), "range": spark_range, "interval": "1d"}
+        response = _session.get(SPARK_URL, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error getting data for {symbols}: {e}")
+        return {}
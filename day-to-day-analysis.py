@@ -1,3 +1,4 @@
+import heapq
 import requests
 import json
 import pandas as pd
@@ -5,25 +6,25 @@ import matplotlib.pyplot as plt
 from typing import TextIO, List
 import datetime as dt
 from matplotlib import style
-import pandas_datareader.data as web
 from datetime import datetime, timedelta
 
+from data_requests import get_data_batch
+
 
 def extract_symbols(f: TextIO) -> List[str]:
     """
-    Given a csv file with delimeter "|", extract all the stock symbols
+    Given a csv file with delimeter "|", extract all the stock symbols. NASDAQ symbols that are missing or contain
+    anything other than letters are left out.
 
     :param: file with all the information
-    :return: A list of all the stock symbols
+    :return: A list of all the stock symbols, and a list of all the usable NASDAQ symbols
     """
 
-    df = pd.read_csv(f, delimiter="|")
-    return df["Symbol"].tolist(), df["NASDAQ Symbol"].tolist()
-
-def get_data(start, end, symbol):
-    df = web.DataReader(symbol, 'yahoo', start, end)
-    return df
-
+    # Only parse the two columns we need, using pyarrow's multithreaded reader. The file ends with a "File Creation
+    # Time" row that has too few fields, which pyarrow would otherwise refuse to parse.
+    df = pd.read_csv(f, delimiter="|", usecols=["Symbol", "NASDAQ Symbol"], engine="pyarrow", on_bad_lines="skip")
+    nasdaq_symbols = df["NASDAQ Symbol"].dropna().astype(str)
+    return df["Symbol"].tolist(), nasdaq_symbols[nasdaq_symbols.str.isalpha()].tolist()
 
 def get_max_increase_from_yesterday():
     """
@@ -34,38 +35,24 @@ def get_max_increase_from_yesterday():
     f = open("nasdaqtraded.txt")
     stock_symbols, nasdaq_stock_symbols = extract_symbols(f)
 
-    result = {}
+    data = get_data_batch(nasdaq_stock_symbols, start, end)
 
-    for i in range(len(nasdaq_stock_symbols)):
-        symbol = nasdaq_stock_symbols[i]
-        if isinstance(symbol, str):
-            if not symbol.isalpha():
-                continue
-        else:
-            continue
+    # A min-heap of (increase, symbol) pairs, so the smallest of the top 100 increases is always at heap[0]
+    heap = []
 
-        try:
-            df = get_data(start, end, symbol)
-        except:
+    for symbol, df in data.items():
+        # Compare the two most recent closes, however many days the window happened to take in
+        close = df['Close'].to_numpy()
+        if close.size < 2:
             continue
-
-        if len(df['Close'].tolist()) != 2:
-            continue
-        yes, td = df['Close'].tolist()[:]
+        yes, td = close[-2:]
 
         inc = (td - yes) / yes
-        if len(result) < 100:
-            result[symbol] = inc
+        if len(heap) < 100:
+            heapq.heappush(heap, (inc, symbol))
         else:
-            min = list(result.keys())[0]
-            for key in result:
-                if result[key] < result[min]:
-                    min = key
-            if result[min] > inc:
-                result.pop(min)
-                result[symbol] = inc
-        print(result)
-    return result
+            heapq.heappushpop(heap, (inc, symbol))
+    return {symbol: inc for inc, symbol in heap}
 
 def get_min_increase_from_yesterday():
     """
@@ -76,38 +63,24 @@ def get_min_increase_from_yesterday():
     f = open("nasdaqtraded.txt")
     stock_symbols, nasdaq_stock_symbols = extract_symbols(f)
 
-    result = {}
+    data = get_data_batch(nasdaq_stock_symbols, start, end)
 
-    for i in range(len(nasdaq_stock_symbols)):
-        symbol = nasdaq_stock_symbols[i]
-        if isinstance(symbol, str):
-            if not symbol.isalpha():
-                continue
-        else:
-            continue
-
-        try:
-            df = get_data(start, end, symbol)
-        except:
-            continue
+    # A min-heap of (-increase, symbol) pairs, so the largest of the bottom 100 increases is always at heap[0]
+    heap = []
 
-        if len(df['Close'].tolist()) != 2:
+    for symbol, df in data.items():
+        # Compare the two most recent closes, however many days the window happened to take in
+        close = df['Close'].to_numpy()
+        if close.size < 2:
             continue
-        yes, td = df['Close'].tolist()[:]
+        yes, td = close[-2:]
 
         inc = (td - yes) / yes
-        if len(result) < 100:
-            result[symbol] = inc
+        if len(heap) < 100:
+            heapq.heappush(heap, (-inc, symbol))
         else:
-            max = list(result.keys())[0]
-            for key in result:
-                if result[key] > result[max]:
-                    max = key
-            if result[max] > inc:
-                result.pop(max)
-                result[symbol] = inc
-        print(result)
-    return result
+            heapq.heappushpop(heap, (-inc, symbol))
+    return {symbol: -inc for inc, symbol in heap}
 
 if __name__ == "__main__":
     result_max = get_max_increase_from_yesterday()
@@ -5,10 +5,11 @@ import matplotlib.pyplot as plt
 from typing import TextIO, List
 import datetime as dt
 from matplotlib import style
-import pandas_datareader.data as web
 from datetime import datetime, timedelta
 import optparse
 
+from data_requests import get_data_batch
+
 """
 Defining parsed objects to take in as commandline arguments
 """
@@ -35,73 +36,52 @@ options, args = parser.parse_args()
 
 def extract_symbols(f: TextIO) -> List[str]:
     """
-    Given a csv file with delimeter "|", extract all the stock symbols
+    Given a csv file with delimeter "|", extract all the stock symbols. Symbols that are missing or contain anything
+    other than letters are left out.
 
     :param: file with all the information
-    :return: A list of all the stock symbols
+    :return: A list of all the usable stock symbols
     """
 
-    df = pd.read_csv(f, delimiter="|")
-    return df["NASDAQ Symbol"].tolist()
-
-def get_data(start, end, symbol):
-    df = web.DataReader(symbol, 'yahoo', start, end)
-    return df
-
+    # Only parse the column we need, using pyarrow's multithreaded reader. The file ends with a "File Creation Time"
+    # row that has too few fields, which pyarrow would otherwise refuse to parse.
+    df = pd.read_csv(f, delimiter="|", usecols=["NASDAQ Symbol"], engine="pyarrow", on_bad_lines="skip")
+    symbols = df["NASDAQ Symbol"].dropna().astype(str)
+    usable = symbols.str.isalpha()
+    print(f"skipped {len(df.index) - usable.sum()} stocks: symbol missing or not all alpha")
+    return symbols[usable].tolist()
 
 def get_max_and_min_increase(query_file: TextIO, start, end, x):
     """
-    Return the top <x> stocks in <query_file> that increased the most from <start> to <end>
+    Return the top <x> stocks in <query_file> that increased the most from <start> to <end>, and the bottom <x> stocks
+    that increased the least, each as a dict mapping symbol to increase
     """
 
-    stock_symbols = extract_symbols(f)
+    symbols = extract_symbols(query_file)
 
-    result_pos = {}
-    result_neg = {}
+    data = get_data_batch(symbols, start, end)
 
-    for i in range(len(stock_symbols)):
-        symbol = stock_symbols[i]
-        if isinstance(symbol, str):
-            if not symbol.isalpha():
-                print("skipped stock: symbol not all alpha")
-                continue
-        else:
-            print("skipped stock: symbol not even string")
-            continue
-
-        try:
-            df = get_data(start, end, symbol)
-        except:
+    records = []
+    for symbol in symbols:
+        if symbol not in data:
             print("skipped stock: could not find data :(")
             continue
+        df = data[symbol]
 
-        if len(df['Close'].tolist()) < 2:
+        close = df['Close'].to_numpy()
+        if close.size < 2:
             print("skipped stock: Not enough data :(")
             continue
-        yes, td = df['Close'].tolist()[0],  df['Close'].tolist()[-1]
-
-        inc = (td - yes) / yes
-
-        if len(result_neg) < x:
-            result_neg[symbol] = inc
-            result_pos[symbol] = inc
-        else:
-            max = list(result_neg.keys())[0]
-            min = list(result_pos.keys())[0]
-            for key in result_pos:
-                if result_pos[key] < result_pos[min]:
-                    min = key
-            for key in result_neg:
-                if result_neg[key] > result_neg[max]:
-                    max = key
-            if result_pos[min] < inc:
-                result_pos.pop(min)
-                result_pos[symbol] = inc
-            if result_neg[max] > inc:
-                result_neg.pop(max)
-                result_neg[symbol] = inc
-        print(result_pos, result_neg)
-    return result_pos, result_neg
+        records.append((symbol, close[0], close[-1]))
+
+    # With every stock's first and last close in one DataFrame, the increases are computed in a single vectorized
+    # step, and the top and bottom <x> are selected by pandas without sorting the whole universe. The closes are made
+    # floats explicitly, since a frame with no records would otherwise have object columns, which nlargest rejects.
+    increases = pd.DataFrame(records, columns=["symbol", "first", "last"]).astype({"first": float, "last": float})
+    increases["pct"] = (increases["last"] - increases["first"]) / increases["first"]
+
+    return (increases.nlargest(x, "pct").set_index("symbol")["pct"].to_dict(),
+            increases.nsmallest(x, "pct").set_index("symbol")["pct"].to_dict())
 
 
 if __name__ == "__main__":
@@ -1,10 +1,15 @@
-import threading
+import functools
+import multiprocessing
+import os
 import sys
+from typing import List, Tuple
+
+import numpy as np
 
 sys.path.append("../")
+from technical_analysis.kernels import scan_oversold
 from technical_analysis.rsi import rsi
-from tools.synced_list import SyncedList
-from tools.messaging import Listener
+from tools.messaging import Listener, MessageLog
 from tools.messaging import Message
 import datetime as datetime
 
@@ -14,6 +19,7 @@ RSI_PERIOD = 25
 START_DATE = datetime.datetime(2010, 1, 1)
 END_DATE = datetime.datetime(2019, 12, 31)
 DAYS_TO_ANALYZE = 10
+NUM_PROCESSES = 6
 
 class IndicatorResultTracker:
     """
@@ -30,20 +36,21 @@ class IndicatorResultTracker:
     """
     def __init__(self, days: int):
         """
-        Initialize this tracker to be able to record data for up to <days> days after an occurrence
+        Initialize this tracker to be able to record data for up to <days> days after an occurrence.
+
+        A tracker isn't thread-safe. Threads or processes working at the same time should each record to a tracker of
+        their own, and the trackers should be combined with merge once they are done.
         """
-        self._num_increases = [0] * days
+        self._num_increases = np.zeros(days, dtype=np.int64)
         self._occurrences = 0
-        self._changes = [0] * days
-        self._num_changes = [0] * days
-        self._lock = threading.Lock()
+        self._changes = np.zeros(days, dtype=np.float64)
+        self._num_changes = np.zeros(days, dtype=np.int64)
 
-    def record_occurrence(self):
+    def record_occurrence(self, count: int = 1):
         """
-        Record an occurrence of the statistical event
+        Record <count> occurrences of the statistical event
         """
-        with self._lock:
-            self._occurrences += 1
+        self._occurrences += count
 
     def record_change(self, change: float, day: int):
         """
@@ -53,11 +60,29 @@ class IndicatorResultTracker:
         For example, if a golden cross occurred on Monday and the closing price on that day as $10, and on Friday the
         closing price was $15, that would be recorded as a change of 0.5 (50%), 4 days after the event.
         """
-        with self._lock:
-            self._changes[day - 1] += change
-            self._num_changes[day - 1] += 1
-            if change > 0:
-                self._num_increases[day - 1] += 1
+        self._changes[day - 1] += change
+        self._num_changes[day - 1] += 1
+        if change > 0:
+            self._num_increases[day - 1] += 1
+
+    def record_totals(self, changes: np.ndarray, num_changes: np.ndarray, num_increases: np.ndarray):
+        """
+        Record many changes at once, already totalled up. Element d-1 of each array should hold, respectively, the sum
+        of a number of changes d days after an event, how many changes that is, and how many of them were increases.
+        """
+        self._changes += changes
+        self._num_changes += num_changes
+        self._num_increases += num_increases
+
+    def merge(self, other: "IndicatorResultTracker"):
+        """
+        Add everything recorded by <other> to this tracker. <other> must record data for the same number of days as this
+        tracker.
+        """
+        self._occurrences += other._occurrences
+        self._changes += other._changes
+        self._num_changes += other._num_changes
+        self._num_increases += other._num_increases
 
     def summarize(self):
         """
@@ -80,7 +105,7 @@ class IndicatorResultTracker:
             print(f"{i + 1} : {100 * (self._changes[i] / self._num_changes[i])}%")
 
         print("Number of Changes:")
-        print(self._num_changes)
+        print(self._num_changes.tolist())
 
 
 def analyze(symbol: str, tracker: IndicatorResultTracker, days: int, listener: Listener):
@@ -100,62 +125,60 @@ def analyze(symbol: str, tracker: IndicatorResultTracker, days: int, listener: L
     # listener.send(msg)
 
     df_rsi = rsi(symbol, START_DATE, END_DATE, RSI_PERIOD, local=True, dir="../data")
+    if df_rsi is None:
+        return
+
+    dates = df_rsi.index
+    rsi_values = df_rsi["RSI"].to_numpy(dtype=np.float64)
+    prices = df_rsi["Adj Close"].to_numpy(dtype=np.float64)
+
+    # The first few RSI values are NaN, which compare as False here, so they never count as oversold
+    oversold = rsi_values <= 20
+    for i in np.flatnonzero(oversold):
+        msg.add_line("=====================================")
+        msg.add_line(f"{symbol} was oversold on {dates[i]}")
+        msg.add_line("=====================================")
+    listener.send(msg)
+    msg.reset()
+
+    # Find each day on which the stock is no longer oversold, having been oversold the day before, and total up how the
+    # price changed over the following <days> days, all in one compiled pass over the data
+    occurrences, changes, num_changes, num_increases = scan_oversold(rsi_values, prices, 20, days)
+    tracker.record_occurrence(occurrences)
+    tracker.record_totals(changes, num_changes, num_increases)
+
+    msg.add_line(f"Recorded {occurrences} occurrences for {symbol}")
+    listener.send(msg)
 
-    last_was_oversold = False
-    if df_rsi is not None:
-        for i in range(len(df_rsi.index)):
-            date = df_rsi.index[i]
-            if df_rsi["RSI"][date] <= 20:
-                if not last_was_oversold:
-                    last_was_oversold = True
-
-                msg.add_line("=====================================")
-                msg.add_line(f"{symbol} was oversold on {date}")
-                msg.add_line("=====================================")
-            else:
-                if last_was_oversold:
-                    listener.send(msg)
-                    msg.reset()
-                    last_was_oversold = False
-
-                    tracker.record_occurrence()
-
-                    listener.send(msg)
-                    msg.reset()
-                    j = i+1
-                    while j <= i + days and j < len(df_rsi.index):
-                        change = (df_rsi["Adj Close"][df_rsi.index[j]] - df_rsi["Adj Close"][df_rsi.index[i]]) / df_rsi["Adj Close"][
-                            df_rsi.index[i]]
-                        msg.add_line(f"Recording change for {symbol} of {format(change, '.5f')} on day {j-i}")
-                        tracker.record_change(change, j - i)
-                        j += 1
-
-                    listener.send(msg)
-                    msg.reset()
-
-
-def _analyze_thread(symbols: SyncedList, tracker: IndicatorResultTracker, days: int, listener: Listener):
-    symbol = symbols.pop()
-    while symbol is not None:
-        msg = Message()
-        msg.add_line(f"Thread {threading.currentThread()} analyzing {symbol}")
-        listener.send(msg)
-        analyze(symbol, tracker, days, listener)
-        symbol = symbols.pop()
-
-
-def analyze_symbols(symbols: SyncedList, days: int):
-    threads = []
+
+def _analyze_one(symbol: str, days: int) -> Tuple[IndicatorResultTracker, Message]:
+    """
+    Analyze <symbol> in a worker process. Returns a tracker holding the results for <symbol> alone, and the lines that
+    analyze printed along the way, for the parent process to combine and print.
+    """
     tracker = IndicatorResultTracker(days)
-    listener = Listener()
+    log = MessageLog()
+
+    msg = Message()
+    msg.add_line(f"Process {os.getpid()} analyzing {symbol}")
+    log.send(msg)
 
-    for i in range(6):
-        x = threading.Thread(target=_analyze_thread, args=(symbols, tracker, days, listener))
-        x.start()
-        threads.append(x)
+    analyze(symbol, tracker, days, log)
 
-    for thread in threads:
-        thread.join()
+    return tracker, log.get_message()
+
+
+def analyze_symbols(symbols: List[str], days: int):
+    # The analysis is CPU-bound Python and pandas code, so threads would mostly spend their time waiting on the GIL.
+    # Instead, symbols are farmed out to a pool of processes, each of which returns a tracker for the symbol it
+    # analyzed. The trackers are combined here, in the parent process.
+    tracker = IndicatorResultTracker(days)
+    listener = Listener()
+
+    with multiprocessing.Pool(NUM_PROCESSES) as pool:
+        for symbol_tracker, msg in pool.imap_unordered(functools.partial(_analyze_one, days=days), symbols):
+            listener.send(msg)
+            tracker.merge(symbol_tracker)
 
     tracker.summarize()
 
@@ -168,6 +191,4 @@ if __name__ == '__main__':
         line = line.strip()
         symbols.append(line)
 
-    synced = SyncedList(symbols)
-
-    analyze_symbols(synced, DAYS_TO_ANALYZE)
+    analyze_symbols(symbols, DAYS_TO_ANALYZE)
@@ -0,0 +1,302 @@
+"""
+Numeric kernels for the technical analysis scripts.
+
+These are compiled with numba when it is installed. Without numba they still work, as ordinary (much slower) Python
+functions, so numba is an optional dependency.
+
+The compiled kernels only take 1-D arrays that are C-contiguous, meaning their elements sit next to each other in
+memory, so that every loop over them streams through memory in order. A column taken out of a DataFrame isn't always
+laid out that way, and may not hold floats at all, so the functions that wrap the kernels (ema, macd_and_signal and
+friends) pass their input through np.ascontiguousarray first, with the dtype the kernel takes. That only copies it if
+it needs to. Code calling a kernel directly must do the same.
+
+The kernels that work on every row of a 2-D array at once live in row_kernels, as they're compiled to run in parallel.
+"""
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit, types
+    _HAVE_NUMBA = True
+
+    # The exact types each kernel is called with. The arrays a kernel only reads from are typed as read-only, which
+    # lets them take both the read-only arrays pandas hands out and ordinary, writable ones.
+    _READ_F64 = types.Array(types.float64, 1, "C", readonly=True)
+    _EMA_SIGNATURE = types.void(_READ_F64, types.int64, types.float64[::1])
+    _MACD_SIGNATURE = types.Tuple((types.float64[::1], types.float64[::1], types.int64))(_READ_F64, types.int64,
+                                                                                          types.int64, types.int64)
+except ImportError:
+    _HAVE_NUMBA = False
+    _EMA_SIGNATURE = _MACD_SIGNATURE = None
+    # Only needed for the versions of the kernels we fall back on without numba
+    import pandas as pd
+
+    def njit(*args, **kwargs):
+        """
+        Stand-in for numba.njit when numba isn't installed. Returns the decorated function unchanged.
+        """
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+"""
+The options that the moving average kernels are compiled with. nogil lets threads run them at the same time, and cache
+saves the compiled code to disk so that compiling them is a one-time cost rather than a cost paid on every run.
+
+Each kernel is also given the exact types it's called with, so it's compiled as soon as this module is imported, and
+calls to it skip numba's type inference. Calling a kernel with any other types, such as an int array of prices, raises
+a TypeError, so the wrappers above the kernels are responsible for converting their input.
+"""
+MOVING_AVERAGE_JIT_OPTIONS = {"cache": True, "fastmath": True, "nogil": True}
+
+"""
+Whether the kernels are compiled. Every compiled kernel is compiled with nogil, so threads calling them can run on
+separate cores at once. Without numba they're ordinary Python code, and threads calling them take turns on the GIL.
+"""
+KERNELS_RELEASE_GIL = _HAVE_NUMBA
+
+
+def sma_pair(x: np.ndarray, n_short: int, n_long: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the <n_short>-day and <n_long>-day simple moving averages of <x>. The first n_short-1 and n_long-1 elements,
+    respectively, of the averages are np.nan. Assumes <x> has at least max(n_short, n_long) elements. <x> may be
+    float32, to halve the memory read, but the averages are always summed and returned as float64.
+
+    Both averages are taken from one cumulative sum of <x>, so <x> is only read once: the sum of a window is the
+    difference between the cumulative sums at either end of it.
+    """
+    totals = cumulative_totals(x)
+    return _sma_from_totals(totals, n_short), _sma_from_totals(totals, n_long)
+
+
+def cumulative_totals(x: np.ndarray) -> np.ndarray:
+    """
+    Return an array one longer than <x>, whose element i is the sum of the first i elements of <x>, summed as float64.
+    The sum of the elements from i up to but not including j is then totals[j] - totals[i].
+    """
+    totals = np.empty(x.shape[0] + 1)
+    totals[0] = 0.0
+    np.cumsum(x, dtype=np.float64, out=totals[1:])
+    return totals
+
+
+def _sma_from_totals(totals: np.ndarray, n: int) -> np.ndarray:
+    """
+    Return the <n>-day simple moving average of the array whose cumulative sums, as returned by cumulative_totals, are
+    <totals>
+    """
+    out = np.empty(totals.shape[0] - 1)
+    out[:n - 1] = np.nan
+    out[n - 1:] = (totals[n:] - totals[:-n]) / n
+    return out
+
+
+def ema(x: np.ndarray, n: int) -> np.ndarray:
+    """
+    Return an array holding the <n>-day exponential moving average of <x>. The average starts off as the simple
+    average of the first <n> elements of <x>, so the first n-1 elements of the result are np.nan. Assumes <x> has at
+    least n+1 elements.
+
+    Uses the compiled ema_core kernel if numba is installed. Otherwise, the average is calculated by pandas' ewm, whose
+    recurrence with adjust=False is exactly ours.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    out = np.empty(x.shape[0])
+    if _HAVE_NUMBA:
+        ema_core(x, n, out)
+        return out
+
+    # ewm starts from the first value that isn't NaN, so blank out the first n-1 values and put the simple average of
+    # the first n in their place
+    out[:n - 1] = np.nan
+    out[n - 1] = x[:n].mean()
+    out[n:] = x[n:]
+    return pd.Series(out).ewm(alpha=2 / (1 + n), adjust=False).mean().to_numpy()
+
+
+@njit(_EMA_SIGNATURE, **MOVING_AVERAGE_JIT_OPTIONS)
+def ema_core(x: np.ndarray, n: int, out: np.ndarray):
+    """
+    Fill <out>, which must be the same length as <x>, with the <n>-day exponential moving average of <x>, as described
+    in ema.
+
+    Releases the GIL while it runs, so threads can calculate averages at the same time.
+    """
+    out[:n - 1] = np.nan
+
+    total = 0.0
+    for i in range(n):
+        total += x[i]
+    out[n - 1] = total / n
+
+    multiplier = 2.0 / (1 + n)
+    for i in range(n, x.shape[0]):
+        out[i] = x[i] * multiplier + out[i - 1] * (1 - multiplier)
+
+
+def macd_and_signal(x: np.ndarray, n_short: int, n_long: int, n_signal: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Return the MACD of <x>, the difference between its <n_short>-day and <n_long>-day EMAs, and the signal line, an
+    <n_signal>-day EMA of the MACD. Also returns the index in <x> of the first day with an MACD value, first =
+    max(n_short, n_long) - 1. Both arrays start from that day, so they are aligned with x[first:], and the first
+    n_signal-1 elements of the signal line are np.nan. Assumes <x> has enough elements for at least one signal value,
+    so at least max(n_short, n_long) + n_signal elements.
+
+    Uses the compiled macd_core kernel if numba is installed. Otherwise, each of the three averages is calculated by
+    ema.
+    """
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if _HAVE_NUMBA:
+        return macd_core(x, n_short, n_long, n_signal)
+
+    first = max(n_short, n_long) - 1
+    macd = ema(x, n_short)[first:] - ema(x, n_long)[first:]
+    return macd, ema(macd, n_signal), first
+
+
+@njit(_MACD_SIGNATURE, **MOVING_AVERAGE_JIT_OPTIONS)
+def macd_core(x: np.ndarray, n_short: int, n_long: int, n_signal: int):
+    """
+    The compiled version of macd_and_signal. Nothing is calculated for, or written to, the days before the first MACD
+    value, other than what it takes to get both EMAs of price up to that day. From then on, all three averages are
+    advanced together in a single pass over <x>.
+    """
+    first = max(n_short, n_long) - 1
+    size = x.shape[0] - first
+    macd = np.empty(size)
+    signal = np.empty(size)
+
+    m_short = 2.0 / (1 + n_short)
+    m_long = 2.0 / (1 + n_long)
+    m_signal = 2.0 / (1 + n_signal)
+
+    # Start each EMA of price off as a simple average, and bring it up to date with the first day of MACD
+    short = 0.0
+    for i in range(n_short):
+        short += x[i]
+    short /= n_short
+    for i in range(n_short, first + 1):
+        short = x[i] * m_short + short * (1 - m_short)
+
+    long = 0.0
+    for i in range(n_long):
+        long += x[i]
+    long /= n_long
+    for i in range(n_long, first + 1):
+        long = x[i] * m_long + long * (1 - m_long)
+
+    # The signal line needs n_signal MACD values before it has its first, simple average. Each phase gets its own loop
+    # so that none of them have to check which phase they're in on every day.
+    macd[0] = short - long
+    signal_value = macd[0]
+    for j in range(1, n_signal):
+        short = x[first + j] * m_short + short * (1 - m_short)
+        long = x[first + j] * m_long + long * (1 - m_long)
+        macd[j] = short - long
+        signal_value += macd[j]
+    signal[:n_signal - 1] = np.nan
+    signal_value /= n_signal
+    signal[n_signal - 1] = signal_value
+
+    for j in range(n_signal, size):
+        short = x[first + j] * m_short + short * (1 - m_short)
+        long = x[first + j] * m_long + long * (1 - m_long)
+        macd[j] = short - long
+        signal_value = macd[j] * m_signal + signal_value * (1 - m_signal)
+        signal[j] = signal_value
+
+    return macd, signal, first
+
+
+def rsi_averages(gain: np.ndarray, loss: np.ndarray, period: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the average gain, the average loss and the RSI for each day, given each day's <gain> and <loss>, with losses
+    as positive numbers. The averages start off as the simple averages of the first <period> days, and from then on are
+    smoothed using Wilder's method: ((period - 1) * previous average + today's value) / period. All three arrays are
+    np.nan for the first period-1 days, or for every day if there are fewer than <period> of them.
+
+    Uses the compiled rsi_core kernel if numba is installed. Otherwise, the averages are calculated by pandas' ewm, as
+    Wilder's method is an exponential average with alpha = 1 / period.
+    """
+    if _HAVE_NUMBA:
+        return rsi_core(np.ascontiguousarray(gain, dtype=np.float64), np.ascontiguousarray(loss, dtype=np.float64),
+                        period)
+
+    averages = []
+    for x in (gain, loss):
+        out = np.full(x.shape[0], np.nan)
+        if x.shape[0] >= period:
+            out[period - 1] = x[:period].mean()
+            out[period:] = x[period:]
+            out = pd.Series(out).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+        averages.append(out)
+
+    # A day with no average loss has an RSI of 100, or NaN if it had no average gain either
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + averages[0] / averages[1])
+    return averages[0], averages[1], rsi
+
+
+@njit(cache=True, nogil=True, error_model="numpy")
+def rsi_core(gain: np.ndarray, loss: np.ndarray, period: int):
+    """
+    The compiled version of rsi_averages. Divides by zero the way NumPy does, rather than raising an error, so a day
+    with no average loss has an RSI of 100. Not compiled with fastmath, which assumes there are no infinities.
+    """
+    size = gain.shape[0]
+    avg_gain = np.full(size, np.nan)
+    avg_loss = np.full(size, np.nan)
+    rsi = np.full(size, np.nan)
+    if size < period:
+        return avg_gain, avg_loss, rsi
+
+    total_gain = 0.0
+    total_loss = 0.0
+    for i in range(period):
+        total_gain += gain[i]
+        total_loss += loss[i]
+    avg_gain[period - 1] = total_gain / period
+    avg_loss[period - 1] = total_loss / period
+    rsi[period - 1] = 100 - 100 / (1 + avg_gain[period - 1] / avg_loss[period - 1])
+
+    for i in range(period, size):
+        avg_gain[i] = ((period - 1) * avg_gain[i - 1] + gain[i]) / period
+        avg_loss[i] = ((period - 1) * avg_loss[i - 1] + loss[i]) / period
+        rsi[i] = 100 - 100 / (1 + avg_gain[i] / avg_loss[i])
+
+    return avg_gain, avg_loss, rsi
+
+
+@njit(cache=True, nogil=True)
+def scan_oversold(rsi: np.ndarray, prices: np.ndarray, threshold: float, days: int):
+    """
+    Scan <rsi> for occurrences of a stock closing above <threshold> having closed at or below it the day before, and
+    measure how the price in <prices> changed in each of the <days> days following each occurrence, relative to the
+    price on the day of the occurrence. NaN values in <rsi> count as being above <threshold>.
+
+    Returns a tuple of four things: the number of occurrences found, and three arrays of length <days> whose element d-1
+    holds, respectively, the sum of all changes d days after an occurrence, the number of those changes, and how many of
+    them were increases. Changes that would fall after the end of <prices> aren't counted.
+    """
+    changes = np.zeros(days)
+    num_changes = np.zeros(days, dtype=np.int64)
+    num_increases = np.zeros(days, dtype=np.int64)
+    occurrences = 0
+
+    last_was_oversold = False
+    for i in range(rsi.shape[0]):
+        if rsi[i] <= threshold:
+            last_was_oversold = True
+        elif last_was_oversold:
+            last_was_oversold = False
+            occurrences += 1
+            for day in range(1, min(days, prices.shape[0] - 1 - i) + 1):
+                change = (prices[i + day] - prices[i]) / prices[i]
+                changes[day - 1] += change
+                num_changes[day - 1] += 1
+                if change > 0:
+                    num_increases[day - 1] += 1
+
+    return occurrences, changes, num_changes, num_increases
@@ -1,24 +1,30 @@
+import collections
 import datetime
 import math
+import os
+import queue
 import sys
 import threading
 import time
-from typing import Optional, List, Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, List, Callable, Tuple, Dict
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
+from pandas.tseries.offsets import BDay
 
 sys.path.append("../")
-from data_requests import get_data
-from tools.messaging import Listener, Message
-from tools.synced_list import SyncedList
+from data_requests import LOCAL_CACHE_SIZE, get_data, get_price_matrix
+from technical_analysis.kernels import KERNELS_RELEASE_GIL, cumulative_totals, ema, macd_and_signal, sma_pair
+from technical_analysis.row_kernels import ema_rows, macd_rows, sma_rows
+from tools.messaging import Listener, Message, MessageLog
 from tools.synced_output import SyncedFile
 
 """
-The number of threads that this script will use to accomplish its task.
+The number of workers, threads or processes, that this script will use to accomplish its task.
 """
-NUM_THREADS = 3
+NUM_WORKERS = os.cpu_count()
 
 """
 The number of days used in calculating the short- and long-term moving averages, respecively, in check_for_cross 
@@ -33,13 +39,32 @@ MACD_SHORT_AVERAGE = 12
 MACD_LONG_AVERAGE = 26
 MACD_SIGNAL_PERIOD = 9
 
+"""
+The number of days in the EMA of price that price must be above for MACD_signal to count a cross
+"""
+MACD_TREND_AVERAGE = 200
+
+"""
+The number of extra trading days of data fetched before the start of a range, on top of however many days of history an
+average needs, to make up for market holidays. See _lookback.
+"""
+HOLIDAY_PADDING = 2
+
 """
 Define the types of analyses that analyze_symbols can run
 """
 GOLDEN_CROSS = 0
 MACD_SIGNAL_CROSS = 1
 
-signal_output = SyncedFile("../output/MACD_signals.txt")
+"""
+The directory that check_for_MACD_signal_crosses reads each symbol's data from
+"""
+DATA_DIR = "../data"
+
+"""
+The file that analyze_symbols saves MACD signals to
+"""
+SIGNAL_OUTPUT_FILE = "../output/MACD_signals.txt"
 
 
 def moving_average(symbol, start, end, n, local=False, dir="") -> Optional[pd.DataFrame]:
@@ -53,42 +78,18 @@ def moving_average(symbol, start, end, n, local=False, dir="") -> Optional[pd.Da
     for at least the first trading day in the range <start>-<end>
 
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True. Will return None if this is not the
-    case.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
+    Will return None if this is not the case.
 
     The returned DataFrame has index "Date" and one column of data, "Average".
 
     Returns None in the event of an error fetching data.
+
+    Use an SMACache instead to calculate more than one average of the same symbol.
     """
     try:
-        # We get data from the given range to ensure that we are returned at least enough data points to calculate an
-        # <n>-day moving average for the day <start>. We use n + 3*n/7 below because weekends and holidays take up
-        # somewhat less than 3/7ths of all days. Note that if there is not enough data to give us this full window,
-        # get_data simply returns whatever it can
-        df = get_data(symbol, start - datetime.timedelta(n + math.ceil((3 * n) / 7)), end, local=local, dir=dir)
-        if df is None:
-            return None
-
-        # Count how many data points we have up to but not including <start> (or whatever the first trading day after
-        # <start> is if <start> happens to be a weekend or holiday)
-        num_preceding = 0
-        while num_preceding < len(df.index) and df.index[num_preceding] < start:
-            num_preceding += 1
-
-        # Raise an error if there are fewer than <n> data points, because then we won't have enough data points to
-        # calculate an n-day moving average on the first day of our range
-        if num_preceding < n:
-            raise NotEnoughDataError(
-                f"Not enough data to calculate {n}-day moving average for {symbol} with range {start}-{end}")
-
-        average = DataFrame()
-        # Since we know we have enough data points, we can set window=n without worrying about the rows that will get
-        # value NaN. This is because we know none of them are in the range we were given, and when we return below we
-        # slice the DataFrame to only include this range.
-        average["Average"] = df["Adj Close"].rolling(window=n).mean()
-
-        return average[start:end]
+        return SMACache(local=local, dir=dir).sma(symbol, start, end, n)
     except KeyError:
         return None
 
@@ -99,8 +100,8 @@ def EMA_from_symbol(symbol, start, end, n, local=False, dir="") -> Optional[Data
     closing price, for the range of dates given by <start> and <end>.
 
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
 
     Returns None in the event of an error fetching data.
 
@@ -108,9 +109,8 @@ def EMA_from_symbol(symbol, start, end, n, local=False, dir="") -> Optional[Data
     value for the first day in the given range
     """
     # We get data from the given range to ensure that we are returned at least enough data points to calculate an
-    # <n>-day EMA for the day <start>. We use (n+1) + 3*(n+1)/7 below because weekends and holidays take up
-    # somewhat less than 3/7ths of all days
-    df = get_data(symbol, start - datetime.timedelta((n + 1) + math.ceil((3 * (n + 1)) / 7)), end, local=local, dir=dir)
+    # <n>-day EMA for the day <start>
+    df = get_data(symbol, _lookback(start, n + 1), end, local=local, dir=dir, columns=["Adj Close"])
 
     if df is None:
         return None
@@ -118,19 +118,17 @@ def EMA_from_symbol(symbol, start, end, n, local=False, dir="") -> Optional[Data
     # Count the number of data points BEFORE <start> that we were able to fetch. To be able to calculate a bona fide
     # EMA for each trading day between <start> and <end>, we need at least n of these, because we need to start with an
     # n-day simple moving average before we can start calculating EMA.
-    num_preceding = 0
-    while num_preceding < len(df.index) and df.index[num_preceding] < start:
-        num_preceding += 1
+    num_preceding = int(df.index.searchsorted(start))
 
     if num_preceding < n:
         raise NotEnoughDataError(f"Not enough data to calculate {n}-day EMA for {symbol}")
 
-    average = DataFrame()
-    average["Price"] = df["Adj Close"]
-    EMA(average, "Price", "EMA", n)
-    average.drop(labels="Price", axis=1, inplace=True)
+    # Work on the prices as an array, and only build the DataFrame we return, for just our range, once the average is
+    # calculated. Our range runs from position num_preceding up to the first day after <end>.
+    last = int(df.index.searchsorted(end, side="right"))
+    average = ema(df["Adj Close"].to_numpy(dtype=np.float64), n)
 
-    return average[start:end]
+    return DataFrame({"EMA": average[num_preceding:last]}, index=df.index[num_preceding:last])
 
 
 def EMA(df: DataFrame, column: str, result: str, n: int):
@@ -147,20 +145,8 @@ def EMA(df: DataFrame, column: str, result: str, n: int):
     # EMA value, so we need at least n+1 data points total.
     if len(df.index) < n + 1:
         raise NotEnoughDataError(f"Not enough data to calculate {n}-day EMA")
-    df[result] = np.nan
-
-    total = 0
-    for i in range(n):
-        total += df[column][df.index[i]]
 
-    # EMA is calculated by starting off with an n-day simple moving average
-    df.loc[df.index[n - 1], result] = total / n
-
-    smoothing = 2
-    multiplier = smoothing / (1 + n)
-    for i in range(n, len(df.index)):
-        df.loc[df.index[i], result] = df[column][df.index[i]] * multiplier + df[result][df.index[i - 1]] * (
-                1 - multiplier)
+    df[result] = ema(df[column].to_numpy(dtype=np.float64), n)
 
 
 def MACD(symbol: str, start: datetime.datetime, end: datetime.datetime, local=False, dir="") -> Optional[DataFrame]:
@@ -169,60 +155,62 @@ def MACD(symbol: str, start: datetime.datetime, end: datetime.datetime, local=Fa
     two columns: "MACD" and "Signal".
 
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
 
     RAISES NotEnoughDataError if there aren't enough historical data points to calculate MACD and Signal for every
     trading day between <start> and <end>.
 
     Returns None in the event of an error fetching data.
     """
-    # We need to fetch enough data so that we can compute MACD for the range <start>-<end>. That means, including
-    # weekends and holidays, we need at least MACD_LONG_AVERAGE + 3 * MACD_LONG_AVERAGE / 7 data points to be able
-    # to calculate MACD for the first day of our range. But, we also need to fetch enough data points to then take an
-    # EMA of the MACD, for the signal line, which is an MACD_SIGNAL_PERIOD-day EMA. So that's why we have the gross
-    # timedelta here.
-    price_data = get_data(symbol, start - datetime.timedelta(
-        MACD_LONG_AVERAGE + 3 * MACD_LONG_AVERAGE / 7 + (MACD_SIGNAL_PERIOD + 1) + 3 * (MACD_SIGNAL_PERIOD) / 7), end,
-                          local=local, dir=dir)
+    # We need to fetch enough data so that we can compute MACD for the range <start>-<end>. That means we need at least
+    # MACD_LONG_AVERAGE data points to be able to calculate MACD for the first day of our range. But, we also need to
+    # fetch enough data points to then take an EMA of the MACD, for the signal line, which is an MACD_SIGNAL_PERIOD-day
+    # EMA.
+    price_data = get_data(symbol, _lookback(start, MACD_LONG_AVERAGE + MACD_SIGNAL_PERIOD), end, local=local, dir=dir,
+                          columns=["Adj Close"])
 
     if price_data is None:
         return None
 
+    return _MACD(price_data, symbol, start, end)
+
+
+def _MACD(price_data: DataFrame, symbol: str, start: datetime.datetime, end: datetime.datetime) -> DataFrame:
+    """
+    Return a DataFrame containing MACD and Signal for each trading day between <start> and <end>, inclusive, as
+    described in MACD. <price_data> is price data for <symbol>, as returned by get_data.
+
+    RAISES NotEnoughDataError if <price_data> doesn't have enough data points before <start>
+    """
     # Count how many data points we have before the first trading day in our range. We need to know if we have enough
     # to calculate what we need to calculate
-    num_preceding = 0
-    while num_preceding < len(price_data.index) and price_data.index[num_preceding] < start:
-        num_preceding += 1
+    num_preceding = int(price_data.index.searchsorted(start))
 
     if num_preceding < MACD_LONG_AVERAGE + MACD_SIGNAL_PERIOD:
         raise NotEnoughDataError(
             f"Not enough data points to calculate MACD and Signal for symbol {symbol} and range {start}-{end}")
 
-    df = DataFrame()
-    df["Price"] = price_data["Adj Close"]
-    EMA(df, "Price", "Short", MACD_SHORT_AVERAGE)
-    EMA(df, "Price", "Long", MACD_LONG_AVERAGE)
-    df["MACD"] = df["Short"] - df["Long"]
-
-    # So now we've got a DataFrame with columns "Price", "Short", "Long", and "MACD". Because "Short" and "Long" are
-    # moving averages, calcualted using our EMA function, they each have some number of NaN values at the beginning.
-    # And because "MACD" = "Short" - "Long", so does "MACD". That means that when we calculate an EMA of "MACD" below,
-    # it'll get messed up unless we remove the NaN values. So we do that first.
-
-    # Iterate until i points to the first row that contains an actual value for MACD
-    i = 0
-    while np.isnan(df["MACD"][df.index[i]]):
-        i += 1
+    # The two EMAs of price, their difference, and the signal line's EMA of that difference are all calculated in one
+    # go. There's no MACD until the long EMA gets going, so the results start from the day it does, <first>.
+    macd_values, signal_values, first = macd_and_signal(price_data["Adj Close"].to_numpy(dtype=np.float64),
+                                                        MACD_SHORT_AVERAGE, MACD_LONG_AVERAGE, MACD_SIGNAL_PERIOD)
 
-    # Chop off all the NaN values
-    df = df[df.index[i]:]
+    # Our range runs from position num_preceding of <price_data> up to the first day after <end>, and the results are
+    # <first> positions behind
+    last = int(price_data.index.searchsorted(end, side="right"))
+    return DataFrame({"MACD": macd_values[num_preceding - first:last - first],
+                      "Signal": signal_values[num_preceding - first:last - first]},
+                     index=price_data.index[num_preceding:last])
 
-    # Add the column "Signal" to the DataFrame as a MACD_SIGNAL_PERIOD EMA of the "MACD" column
-    EMA(df, "MACD", "Signal", MACD_SIGNAL_PERIOD)
 
-    df.drop(labels=["Short", "Long"], axis=1, inplace=True)
-    return df[start:end]
+def _lookback(start: datetime.datetime, n: int) -> datetime.datetime:
+    """
+    Return the date from which data has to be fetched to get <n> trading days of data before <start>, give or take
+    market holidays. BDay knows to skip weekends but not holidays, so a few extra days are added to make up for them:
+    HOLIDAY_PADDING, plus one for every 25 trading days, as the market is closed for roughly one weekday in 25.
+    """
+    return (start - BDay(n + math.ceil(n / 25) + HOLIDAY_PADDING)).to_pydatetime()
 
 
 class NotEnoughDataError(Exception):
@@ -239,6 +227,84 @@ class NotEnoughDataError(Exception):
         return self.message
 
 
+class SMACache:
+    """
+    Serves <n>-day simple moving averages of the "Adj Close" price of symbols, for any range and any <n>, from a single
+    cumulative sum of each symbol's prices. The sum of the prices in any window is the difference between two of these
+    cumulative sums, so once a symbol's prices have been summed, each average only takes two binary searches for the
+    ends of the range and one subtraction per day, no matter how many different ranges and windows are asked for.
+
+    A symbol's prices are fetched the first time it's asked for. Local data is read whole, so it is never fetched again.
+    Data from Yahoo only covers the range that was asked for, so it is fetched again, covering both the old and the new
+    range, if a later average needs more than that.
+
+    === Private Attributes ===
+        _local : Whether prices are read from the local directory <_dir>, as in get_data
+        _totals : Maps each symbol to its dates, the cumulative sums of its prices (see cumulative_totals), and the
+            first and last days of the range its prices were fetched for. The range is (None, None) for local data,
+            which covers every day.
+    """
+
+    def __init__(self, local=False, dir=""):
+        self._local = local
+        self._dir = dir
+        self._totals: Dict[str, Tuple[pd.DatetimeIndex, np.ndarray, Optional[datetime.datetime],
+                                      Optional[datetime.datetime]]] = {}
+
+    def sma(self, symbol: str, start: datetime.datetime, end: datetime.datetime, n: int) -> Optional[DataFrame]:
+        """
+        Return the same DataFrame as moving_average: an <n>-day moving average of <symbol> for each trading day between
+        <start> and <end>, inclusive, in the column "Average".
+
+        Returns None in the event of an error fetching data.
+
+        RAISES NotEnoughDataError if there aren't at least <n> data points before <start>
+        """
+        cached = self._get_totals(symbol, _lookback(start, n), end)
+        if cached is None:
+            return None
+        index, totals = cached
+
+        # The positions of the first day in our range, and of the first day after it
+        first = int(index.searchsorted(start))
+        last = int(index.searchsorted(end, side="right"))
+        if first < n:
+            raise NotEnoughDataError(
+                f"Not enough data to calculate {n}-day moving average for {symbol} with range {start}-{end}")
+
+        # totals[i + 1] is the sum of the prices up to and including day i, so the sum of the n prices ending on day i
+        # is totals[i + 1] - totals[i + 1 - n]
+        averages = (totals[first + 1:last + 1] - totals[first + 1 - n:last + 1 - n]) / n
+        return DataFrame({"Average": averages}, index=index[first:last])
+
+    def _get_totals(self, symbol: str, start: datetime.datetime,
+                    end: datetime.datetime) -> Optional[Tuple[pd.DatetimeIndex, np.ndarray]]:
+        """
+        Return the dates and the cumulative sums of the prices of <symbol>, fetching its prices from <start> to <end>
+        first if they haven't been already. Returns None if the prices couldn't be fetched.
+        """
+        cached = self._totals.get(symbol)
+        if cached is not None:
+            index, totals, fetched_start, fetched_end = cached
+            if self._local or (fetched_start <= start and end <= fetched_end):
+                return index, totals
+
+            # Fetch the new range and the old one together, so that neither has to be fetched again
+            start = min(start, fetched_start)
+            end = max(end, fetched_end)
+
+        df = get_data(symbol, start, end, local=self._local, dir=self._dir, columns=["Adj Close"])
+        if df is None or "Adj Close" not in df.columns:
+            return None
+
+        # Prices only need float32's precision, but cumulative_totals sums them as float64
+        totals = cumulative_totals(df["Adj Close"].to_numpy(dtype=np.float32))
+        if self._local:
+            start, end = None, None
+        self._totals[symbol] = (df.index, totals, start, end)
+        return df.index, totals
+
+
 def MACD_signal(symbol: str, listener: Listener, start: datetime.datetime, end: datetime.datetime, local=False,
                 dir="") -> \
         List[datetime.datetime]:
@@ -248,14 +314,21 @@ def MACD_signal(symbol: str, listener: Listener, start: datetime.datetime, end:
     <end> where MACD was above its signal line having been below it the day before.
 
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
 
     Prints a message to the console using <listener> and returns an empty list if not enough data could be found to
     compute the necessary values.
     """
+    # Fetch enough data for both MACD and the MACD_TREND_AVERAGE-day EMA of price once, and calculate both from it
+    n = max(MACD_LONG_AVERAGE + MACD_SIGNAL_PERIOD, MACD_TREND_AVERAGE + 1)
+    data = get_data(symbol, _lookback(start, n), end, local=local, dir=dir, columns=["Adj Close"])
+    if data is None:
+        return []
+
     try:
-        macd = MACD(symbol, start, end, local=local, dir=dir)
+        macd = _MACD(data, symbol, start, end)
+        EMA(data, "Adj Close", "EMA", MACD_TREND_AVERAGE)
     except NotEnoughDataError as e:
         msg = Message()
         msg.add_line(str(e))
@@ -263,25 +336,56 @@ def MACD_signal(symbol: str, listener: Listener, start: datetime.datetime, end:
 
         return []
 
-    # Get a 200-day EMA of price
-    data = get_data(symbol, start, end, local=local, dir=dir)
-    if data is None:
-        return []
+    # Compare whole arrays at once rather than looking up each day by label. Element i of each side of the mask below
+    # is about day i+1 of <macd>, and the day before it.
+    macd_values = macd["MACD"].to_numpy()
+    signal_values = macd["Signal"].to_numpy()
+    above_ema = (data["Adj Close"] > data["EMA"]).reindex(macd.index, fill_value=False).to_numpy()
+    crossed = (macd_values[:-1] <= signal_values[:-1]) & (macd_values[1:] > signal_values[1:]) & above_ema[1:]
 
-    try:
-        EMA(data, "Adj Close", "EMA", 200)
-    except NotEnoughDataError as e:
-        msg = Message()
-        msg.add_line(str(e))
-        listener.send(msg)
+    return list(macd.index[1:][crossed])
+
+
+def MACD_signals(symbols: List[str], start: datetime.datetime, end: datetime.datetime,
+                 dir: str) -> Optional[Dict[str, List[datetime.datetime]]]:
+    """
+    Look for crosses of the MACD of each symbol in <symbols> above its signal line WHILE price is also above the
+    MACD_TREND_AVERAGE-day EMA, between <start> and <end>, as MACD_signal does, but for all of them at once.
 
-    signals = []
-    for i in range(1, len(macd.index)):
-        day_before = macd.index[i - 1]
-        day = macd.index[i]
-        if macd["MACD"][day] > macd["Signal"][day] and macd["MACD"][day_before] <= macd["Signal"][day_before] and \
-                data["Adj Close"][day] > data["EMA"][day]:
-            signals.append(day)
+    Reads every symbol's prices in one go from the file that prewarm gathered the files in <dir> into. Like a local
+    read by get_data, it reads each symbol's whole history, so that the averages start from the same day they would in
+    MACD_signal. The averages of all the symbols are then calculated by macd_rows and ema_rows, which split the symbols
+    between all of the machine's cores.
+
+    Returns a dict mapping each symbol to the list of days on which its crosses ended. Symbols without enough data to
+    calculate MACD, Signal and the EMA for every day in the range are left out of the dict. Returns None if the prices
+    couldn't be read.
+    """
+    prices = get_price_matrix(symbols, None, end, dir)
+    if prices is None:
+        return None
+
+    values = prices.to_numpy(dtype=np.float64)
+    num_preceding = int(prices.columns.searchsorted(start))
+    is_price = ~np.isnan(values)
+    has_enough = (np.count_nonzero(is_price[:, :num_preceding], axis=1) >= MACD_LONG_AVERAGE + MACD_SIGNAL_PERIOD) & \
+                 (np.count_nonzero(is_price, axis=1) >= MACD_TREND_AVERAGE + 1)
+
+    macd, signal = macd_rows(values, MACD_SHORT_AVERAGE, MACD_LONG_AVERAGE, MACD_SIGNAL_PERIOD)
+    trend = ema_rows(values, MACD_TREND_AVERAGE)
+
+    # The same mask as MACD_signal, over every symbol's row at once
+    macd = macd[:, num_preceding:]
+    signal = signal[:, num_preceding:]
+    above_trend = values[:, num_preceding:] > trend[:, num_preceding:]
+    crossed = (macd[:, :-1] <= signal[:, :-1]) & (macd[:, 1:] > signal[:, 1:]) & above_trend[:, 1:]
+
+    days = prices.columns[num_preceding + 1:]
+    signals = {symbol: [] for symbol, enough in zip(prices.index, has_enough) if enough}
+    for row, column in zip(*np.nonzero(crossed)):
+        symbol = prices.index[row]
+        if symbol in signals:
+            signals[symbol].append(days[column])
 
     return signals
 
@@ -294,109 +398,271 @@ def golden_cross(symbol: str, listener: Listener, short: int, long: int, start:
     having been below the long-term average on the previous day.
 
     If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
     """
     msg = Message()
 
-    try:
-        short_average = moving_average(symbol, start, end, short, local=local, dir=dir)
-        long_average = moving_average(symbol, start, end, long, local=local, dir=dir)
-    except NotEnoughDataError as e:
-        msg.add_line(str(e))
+    # Fetch enough data for the longer of the two averages once, and calculate both averages from the same array of
+    # prices, rather than having moving_average fetch (mostly) the same data twice
+    n = max(short, long)
+    df = get_data(symbol, _lookback(start, n), end, local=local, dir=dir, columns=["Adj Close"])
+
+    if df is None or "Adj Close" not in df.columns:
+        msg.add_line("******************************************************")
+        msg.add_line(f"Couldn't get data for {symbol}")
+        msg.add_line("******************************************************")
         listener.send(msg)
 
         return []
 
-    if short_average is not None and long_average is not None:
-
-        days = short_average.index
+    # Count how many data points we have up to but not including <start>. We need at least <n> of them to calculate
+    # both averages on the first trading day of our range.
+    num_preceding = int(df.index.searchsorted(start))
 
-        crosses = []
-        for i in range(len(days) - 1):
-            if (short_average["Average"][days[i]] <= long_average["Average"][days[i]]
-                    and short_average["Average"][days[i + 1]] > long_average["Average"][days[i + 1]]):
-                crosses.append(days[i + 1])
-
-        return crosses
-    else:
-        msg.add_line("******************************************************")
-        msg.add_line(f"Couldn't get data for {symbol}")
-        msg.add_line("******************************************************")
+    if num_preceding < n:
+        msg.add_line(f"Not enough data to calculate {n}-day moving average for {symbol} with range {start}-{end}")
         listener.send(msg)
 
         return []
 
+    # Both averages line up with df.index, so we can compare them as plain arrays, starting from the first day of our
+    # range. A cross ends on each day where the short average is above the long one, having been at or below it the
+    # day before. Prices are handed to sma_pair as float32, as in SMACache.
+    prices = df["Adj Close"].to_numpy(dtype=np.float32)
+    short_values, long_values = sma_pair(prices, short, long)
+    short_values = short_values[num_preceding:]
+    long_values = long_values[num_preceding:]
+    crossed = (short_values[:-1] <= long_values[:-1]) & (short_values[1:] > long_values[1:])
+
+    # Local data isn't limited to our range, so drop any crosses after <end>
+    crosses = df.index[num_preceding + 1:][crossed]
+    return list(crosses[crosses <= end])
+
+
+def golden_crosses(symbols: List[str], short: int, long: int, start: datetime.datetime, end: datetime.datetime,
+                   dir: str) -> Optional[Dict[str, List[datetime.datetime]]]:
+    """
+    Check every symbol in <symbols> for crosses by the <short>-day moving average above the <long>-day moving average
+    some time between <start> and <end>, as golden_cross does, but for all of them at once.
+
+    Reads every symbol's prices in one go from the file that prewarm gathered the files in <dir> into, and calculates
+    the averages of all of them in a single call to sma_rows, which splits the symbols between all of the machine's
+    cores.
+
+    Returns a dict mapping each symbol to the list of days its crosses ended on. Symbols that don't have at least
+    max(<short>, <long>) data points before <start> are left out of the dict. Returns None if the prices couldn't be
+    read.
+    """
+    n = max(short, long)
+    prices = get_price_matrix(symbols, _lookback(start, n), end, dir)
+    if prices is None:
+        return None
+
+    # As in golden_cross, count the data points before <start>, but for every symbol at once
+    num_preceding = int(prices.columns.searchsorted(start))
+    values = prices.to_numpy()
+    has_enough = np.count_nonzero(~np.isnan(values[:, :num_preceding]), axis=1) >= n
+
+    short_values = sma_rows(values, short)[:, num_preceding:]
+    long_values = sma_rows(values, long)[:, num_preceding:]
+    # The same mask as golden_cross, over every symbol's row at once
+    crossed = (short_values[:, :-1] <= long_values[:, :-1]) & (short_values[:, 1:] > long_values[:, 1:])
+
+    days = prices.columns[num_preceding + 1:]
+    crosses = {symbol: [] for symbol, enough in zip(prices.index, has_enough) if enough}
+    for row, column in zip(*np.nonzero(crossed)):
+        symbol = prices.index[row]
+        if symbol in crosses:
+            crosses[symbol].append(days[column])
+
+    return crosses
+
 
-def check_for_crosses(lst: SyncedList, listener: Listener, start: datetime.datetime, end: datetime.datetime):
+def check_for_crosses(symbol: str, start: datetime.datetime, end: datetime.datetime) -> Tuple[Message, Message]:
     """
-    Check for crosses of the <short>-day moving average above the <long>-day moving average in the last five days of
-    trading. <lst> should be a SyncedList of stock symbols, and <listener> is what the threads spawned to accomplish the
-    task will use to communicate with the console. 
+    Check for crosses of the <short>-day moving average above the <long>-day moving average of <symbol> between <start>
+    and <end>. Meant to be run by one of the workers of analyze_symbols.
+
+    Returns the lines to print to the console, and the lines to save to the output file. Golden crosses aren't saved, so
+    the second Message is always empty.
     """
+    log = MessageLog()
     msg = Message()
-    symbol = lst.pop()
-    while symbol is not None:
-        msg.add_line("Analyzing symbol...")
-        listener.send(msg)
-        msg.reset()
+    msg.add_line("Analyzing symbol...")
+    log.send(msg)
+    msg.reset()
 
-        crosses = golden_cross(symbol, listener, SHORT_MOVING_AVERAGE, LONG_MOVING_AVERAGE, start, end)
-        for cross in crosses:
-            msg.add_line("=========================================")
-            msg.add_line(f"Cross above for {symbol} on {cross}")
-            listener.send(msg)
-            msg.reset()
+    # Collect the lines for every cross, and send them all at once
+    crosses = golden_cross(symbol, log, SHORT_MOVING_AVERAGE, LONG_MOVING_AVERAGE, start, end)
+    for cross in crosses:
+        msg.add_lines(["=========================================", f"Cross above for {symbol} on {cross}"])
+    log.send(msg)
 
-        symbol = lst.pop()
+    return log.get_message(), Message()
 
 
-def check_for_MACD_signal_crosses(lst: SyncedList, listener: Listener, start: datetime.datetime,
-                                  end: datetime.datetime):
+def check_for_crosses_batch(symbols: List[str], start: datetime.datetime, end: datetime.datetime, dir="../data"):
     """
-    Check each stock symbol in the given SyncedList for crosses of the MACD above its signal line while price is above
-    its 200-day EMA during the period from <start> to <end>. Print a message to the console for each such cross found.
+    Check every symbol in <symbols> for crosses of the <short>-day moving average above the <long>-day moving average
+    between <start> and <end>, printing the same messages that running check_for_crosses on each of them through
+    analyze_symbols would.
+
+    Rather than handing the symbols out to a pool of processes, this calculates every symbol's averages in one parallel
+    call, using golden_crosses. The files in <dir> must have been passed to prewarm first.
     """
-    symbol = lst.pop()
+    crosses = golden_crosses(symbols, SHORT_MOVING_AVERAGE, LONG_MOVING_AVERAGE, start, end, dir)
+    if crosses is None:
+        return
+
     msg = Message()
+    for symbol in symbols:
+        if symbol not in crosses:
+            msg.add_line(f"Not enough data to calculate {LONG_MOVING_AVERAGE}-day moving average for {symbol} with "
+                         f"range {start}-{end}")
+            continue
 
-    while symbol is not None:
-        msg.add_line(f"Analyzing {symbol}...")
-        listener.send(msg)
-        msg.reset()
-        signals = MACD_signal(symbol, listener, start, end, local=True, dir="../data")
+        for cross in crosses[symbol]:
+            msg.add_lines(["=========================================", f"Cross above for {symbol} on {cross}"])
+
+    listener = Listener()
+    listener.send(msg)
+    listener.flush()
+
+
+def check_for_MACD_signal_crosses(symbol: str, start: datetime.datetime,
+                                  end: datetime.datetime) -> Tuple[Message, Message]:
+    """
+    Check <symbol> for crosses of the MACD above its signal line while price is above its 200-day EMA during the period
+    from <start> to <end>. Meant to be run by one of the workers of analyze_symbols.
+
+    Returns the lines to print to the console, and the lines to save to the output file: one block for each cross found.
+    """
+    log = MessageLog()
+    signals_found = Message()
+    msg = Message()
+
+    msg.add_line(f"Analyzing {symbol}...")
+    log.send(msg)
+    signals = MACD_signal(symbol, log, start, end, local=True, dir=DATA_DIR)
+
+    # Collect the lines for every signal, and send them all at once
+    for signal in signals:
+        signals_found.add_lines(["======================================", f"Signal on {signal} for {symbol}",
+                                 "======================================"])
+    log.send(signals_found)
 
-        for signal in signals:
-            msg.add_line("======================================")
-            msg.add_line(f"Signal on {signal} for {symbol}")
-            msg.add_line("======================================")
-            listener.send(msg)
-            signal_output.save(msg)
-            msg.reset()
+    return log.get_message(), signals_found
 
-        symbol = lst.pop()
 
+def check_for_MACD_signal_crosses_batch(symbols: List[str], start: datetime.datetime, end: datetime.datetime,
+                                        dir="../data"):
+    """
+    Check every symbol in <symbols> for crosses of the MACD above its signal line while price is above its 200-day EMA
+    during the period from <start> to <end>, printing and saving the same messages that running
+    check_for_MACD_signal_crosses on each of them through analyze_symbols would.
 
-def analyze_symbols(lst: SyncedList, start: datetime.datetime, end: datetime.datetime,
-                    func: Callable[[SyncedList, Listener, datetime.datetime, datetime.datetime], None]) -> \
-        List[threading.Thread]:
+    Rather than handing the symbols out to a pool of processes, this calculates every symbol's averages in one parallel
+    call, using MACD_signals. The files in <dir> must have been passed to prewarm first.
     """
-    Spawns NUM_THREADS threads to analyze the given list of symbols. <func> is the method that each thread will run.
-    It's signature should match the above. It should take a SyncedList of symbols to analyze, a Listener object with
-    which to communicate with the console, and two dates: a start date for analysis and an end date for analysis. It
-    should return nothing.
+    signals = MACD_signals(symbols, start, end, dir)
+    if signals is None:
+        return
+
+    msg = Message()
+    signals_found = Message()
+    for symbol in symbols:
+        if symbol not in signals:
+            msg.add_line(f"Not enough data points to calculate MACD, Signal and {MACD_TREND_AVERAGE}-day EMA for "
+                         f"symbol {symbol} and range {start}-{end}")
+            continue
+
+        for signal in signals[symbol]:
+            signals_found.add_lines(["======================================", f"Signal on {signal} for {symbol}",
+                                     "======================================"])
+
+    listener = Listener()
+    listener.send(msg)
+    listener.send(signals_found)
+    listener.flush()
+    if signals_found.get_lines():
+        SyncedFile(SIGNAL_OUTPUT_FILE).save(signals_found)
+
+
+def analyze_symbols(symbols: List[str], start: datetime.datetime, end: datetime.datetime,
+                    func: Callable[[str, datetime.datetime, datetime.datetime], Tuple[Message, Message]],
+                    prefetch=False):
     """
+    Analyze the given list of symbols using a pool of NUM_WORKERS workers, and wait for them to finish. <func> is
+    the method that is run on each symbol. It's signature should match the above. It should take a symbol to analyze and
+    two dates: a start date for analysis and an end date for analysis. It should return two Messages: the lines to print
+    to the console, and the lines to save to SIGNAL_OUTPUT_FILE.
+
+    If <prefetch>=True, <func> is assumed to read the "Adj Close" prices of its symbol from the local directory
+    DATA_DIR with get_data, as check_for_MACD_signal_crosses does. When the workers are threads, a separate thread
+    then reads each symbol's file into get_data's cache a few symbols ahead of them, so that the workers find their
+    prices already read rather than each waiting on the disk before they can start calculating.
+    """
+    # The analysis is mostly CPU-bound. When numba is installed, the kernels doing the heavy lifting release the GIL, so
+    # threads can run them side by side, without the cost of starting processes and pickling every result back, and
+    # all of them share get_data's in-memory cache. Otherwise, threads would spend their time waiting on the GIL, so
+    # each symbol is handed to a worker process instead. Either way, only this thread writes to the console and the
+    # output file.
     listener = Listener()
+    signal_output = SyncedFile(SIGNAL_OUTPUT_FILE)
+
+    # The most symbols handed to the workers that haven't been reported yet
+    window = 2 * NUM_WORKERS
+    if prefetch and KERNELS_RELEASE_GIL:
+        # Files read ahead are only worth reading if they're still in get_data's cache by the time a worker asks for
+        # them. At most <window> symbols handed to workers, every symbol in <ready>, and the one the reader is waiting
+        # to put in <ready> have been read but maybe not used yet, so keep them to LOCAL_CACHE_SIZE between them. The
+        # reader waits whenever <ready> is full.
+        window = max(1, min(window, LOCAL_CACHE_SIZE // 2))
+        ready = queue.Queue(maxsize=max(1, LOCAL_CACHE_SIZE - window - 1))
+        threading.Thread(target=_read_ahead, args=(symbols, ready), daemon=True).start()
+        symbols = iter(ready.get, None)
+
+    executor_type = ThreadPoolExecutor if KERNELS_RELEASE_GIL else ProcessPoolExecutor
+    with executor_type(max_workers=NUM_WORKERS) as executor:
+        # Symbols are only handed out <window> at a time ahead of the ones being finished, rather than all at once, so
+        # that the files read ahead of time are used before they can drop out of get_data's cache. Results are still
+        # reported in the order of <symbols>.
+        pending = collections.deque()
+        for symbol in symbols:
+            pending.append(executor.submit(func, symbol, start, end))
+            if len(pending) >= window:
+                _report(pending.popleft().result(), listener, signal_output)
+
+        while pending:
+            _report(pending.popleft().result(), listener, signal_output)
+
+    listener.flush()
+
+
+def _read_ahead(symbols: List[str], ready: queue.Queue):
+    """
+    Read the prices of each symbol in <symbols> from DATA_DIR into get_data's cache, putting each symbol in <ready> once
+    its prices have been read, and then None once they all have. Run on its own thread by analyze_symbols.
+    """
+    try:
+        for symbol in symbols:
+            # Local reads don't depend on the range, and the result is only wanted for the copy left in the cache
+            get_data(symbol, None, None, local=True, dir=DATA_DIR, columns=["Adj Close"])
+            ready.put(symbol)
+    finally:
+        ready.put(None)
 
-    threads = []
-    # Start NUM_THREADS different threads, each drawing from the same central list of symbols, to look for golden
-    # crosses
-    for i in range(NUM_THREADS):
-        x = threading.Thread(target=func, args=(lst, listener, start, end))
-        x.start()
-        threads.append(x)
 
-    return threads
+def _report(result: Tuple[Message, Message], listener: Listener, signal_output: SyncedFile):
+    """
+    Print the first Message of <result>, as returned by one of the workers of analyze_symbols, with <listener>, and save
+    the second to <signal_output>, if it has any lines
+    """
+    msg, signals = result
+    listener.send(msg)
+    if signals.get_lines():
+        signal_output.save(signals)
 
 
 """
@@ -411,15 +677,10 @@ if __name__ == '__main__':
         line = line.strip()
         securities.append(line)
 
-    lst = SyncedList(securities)
-
     start = time.time()
-    threads = analyze_symbols(lst, datetime.datetime.today() - datetime.timedelta(7), datetime.datetime.today(),
-                              check_for_MACD_signal_crosses)
-    main_thread = threading.current_thread()
-    for thread in threads:
-        if thread is not main_thread:
-            thread.join()
+    # Read the clock once, so that both ends of the range are measured from the same moment
+    today = datetime.datetime.today()
+    analyze_symbols(securities, today - datetime.timedelta(7), today, check_for_MACD_signal_crosses, prefetch=True)
 
     end = time.time()
 
@@ -0,0 +1,166 @@
+"""
+Numeric kernels that work on a 2-D array of prices, one row per symbol, calculating every row at once.
+
+When numba is installed, these are compiled to split the rows between all of the machine's cores. They're kept apart
+from the kernels module because a process that has run parallel numba code can't safely be forked, and its threading
+layer can leave a forked pool hanging when the interpreter exits. Scripts that fork worker processes, like
+historical_rsi, import kernels without importing this module, so nothing parallel is compiled or run before they fork.
+
+As with the kernels in kernels, each row passed to a compiled kernel must be C-contiguous, which the wrappers ensure.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from technical_analysis.kernels import ema, ema_core, macd_and_signal, macd_core, njit
+
+try:
+    from numba import prange, types
+    _HAVE_NUMBA = True
+
+    # The exact types each kernel is called with, as in kernels
+    _SMA_ROWS_SIGNATURE = types.void(types.Array(types.float32, 2, "C", readonly=True), types.int64,
+                                     types.float64[:, ::1])
+    _READ_F64_ROWS = types.Array(types.float64, 2, "C", readonly=True)
+    _EMA_ROWS_SIGNATURE = types.void(_READ_F64_ROWS, types.int64, types.float64[:, ::1])
+    _MACD_ROWS_SIGNATURE = types.void(_READ_F64_ROWS, types.int64, types.int64, types.int64, types.float64[:, ::1],
+                                      types.float64[:, ::1])
+except ImportError:
+    _HAVE_NUMBA = False
+    _SMA_ROWS_SIGNATURE = _EMA_ROWS_SIGNATURE = _MACD_ROWS_SIGNATURE = None
+    prange = range
+    # Only needed for the version of sma_rows we fall back on without numba
+    import pandas as pd
+
+
+def sma_rows(prices: np.ndarray, n: int) -> np.ndarray:
+    """
+    Return an array the same shape as the 2-D array <prices>, each row of which holds the <n>-day simple moving average
+    of the same row of <prices>. Each row is the prices of one symbol, and may start with np.nan for days before the
+    symbol has any prices; the average starts from the first actual price, so it is np.nan for that row's first n-1
+    prices. Assumes there are no np.nan's in a row after its first actual price.
+
+    Uses the compiled move_mean_rows kernel, which averages the rows in parallel, if numba is installed. Otherwise, the
+    averages are calculated by pandas' rolling mean.
+    """
+    if _HAVE_NUMBA:
+        out = np.empty(prices.shape)
+        move_mean_rows(np.ascontiguousarray(prices, dtype=np.float32), n, out)
+        return out
+
+    # rolling works down columns, so the rows have to be turned into columns and back
+    return pd.DataFrame(prices.T).rolling(n).mean().to_numpy().T
+
+
+@njit(cache=True, nogil=True)
+def _first_price(x: np.ndarray) -> int:
+    """
+    Return the index of the first element of <x> that isn't np.nan, or len(x) if they all are
+    """
+    start = 0
+    while start < x.shape[0] and np.isnan(x[start]):
+        start += 1
+    return start
+
+
+@njit(_SMA_ROWS_SIGNATURE, cache=True, nogil=True, parallel=True)
+def move_mean_rows(prices: np.ndarray, n: int, out: np.ndarray):
+    """
+    The compiled version of sma_rows, which fills <out> with the averages. Each row's average keeps a running sum of its
+    window, adding the newest price and subtracting the one that just left, and the rows are split between all of the
+    machine's cores. This isn't compiled with fastmath, as it has to check for NaN's.
+    """
+    for row in prange(prices.shape[0]):
+        x = prices[row]
+        size = x.shape[0]
+        start = _first_price(x)
+
+        out[row, :min(start + n - 1, size)] = np.nan
+        if start + n > size:
+            continue
+
+        total = 0.0
+        for i in range(start, start + n):
+            total += x[i]
+        out[row, start + n - 1] = total / n
+
+        for i in range(start + n, size):
+            total += x[i]
+            total -= x[i - n]
+            out[row, i] = total / n
+
+
+def ema_rows(prices: np.ndarray, n: int) -> np.ndarray:
+    """
+    Return an array the same shape as the 2-D array <prices>, each row of which holds the <n>-day exponential moving
+    average of the same row of <prices>, as described in ema. As in sma_rows, each row is the prices of one symbol, and
+    may start with np.nan for days before the symbol has any prices. A row's average starts from its first actual price,
+    and a row with n or fewer prices has no average at all.
+
+    Uses the compiled ema_rows_core kernel, which averages the rows in parallel, if numba is installed. Otherwise, each
+    row is averaged in turn by ema.
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    out = np.full(prices.shape, np.nan)
+    if _HAVE_NUMBA:
+        ema_rows_core(prices, n, out)
+        return out
+
+    for row in range(prices.shape[0]):
+        start = _first_price(prices[row])
+        if prices.shape[1] - start > n:
+            out[row, start:] = ema(prices[row, start:], n)
+    return out
+
+
+def macd_rows(prices: np.ndarray, n_short: int, n_long: int, n_signal: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return two arrays the same shape as the 2-D array <prices>, each row of which holds the MACD and the signal line,
+    respectively, of the same row of <prices>, as described in macd_and_signal. Unlike macd_and_signal, the days
+    without a value are np.nan, rather than cut off, so that every row still lines up with the same days. Rows are
+    laid out as in ema_rows, and a row without enough prices for a signal value has no MACD or signal line at all.
+
+    Uses the compiled macd_rows_core kernel, which calculates the rows in parallel, if numba is installed. Otherwise,
+    each row is calculated in turn by macd_and_signal.
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    macd = np.full(prices.shape, np.nan)
+    signal = np.full(prices.shape, np.nan)
+    if _HAVE_NUMBA:
+        macd_rows_core(prices, n_short, n_long, n_signal, macd, signal)
+        return macd, signal
+
+    for row in range(prices.shape[0]):
+        start = _first_price(prices[row])
+        if prices.shape[1] - start >= max(n_short, n_long) + n_signal:
+            row_macd, row_signal, first = macd_and_signal(prices[row, start:], n_short, n_long, n_signal)
+            macd[row, start + first:] = row_macd
+            signal[row, start + first:] = row_signal
+    return macd, signal
+
+
+@njit(_EMA_ROWS_SIGNATURE, cache=True, nogil=True, parallel=True)
+def ema_rows_core(prices: np.ndarray, n: int, out: np.ndarray):
+    """
+    The compiled version of ema_rows, which fills <out>, already filled with np.nan, with the averages. Each row is
+    averaged by ema_core, and the rows are split between all of the machine's cores.
+    """
+    for row in prange(prices.shape[0]):
+        start = _first_price(prices[row])
+        if prices.shape[1] - start > n:
+            ema_core(prices[row, start:], n, out[row, start:])
+
+
+@njit(_MACD_ROWS_SIGNATURE, cache=True, nogil=True, parallel=True)
+def macd_rows_core(prices: np.ndarray, n_short: int, n_long: int, n_signal: int, macd: np.ndarray,
+                   signal: np.ndarray):
+    """
+    The compiled version of macd_rows, which fills <macd> and <signal>, already filled with np.nan, with the results.
+    Each row is calculated by macd_core, and the rows are split between all of the machine's cores.
+    """
+    for row in prange(prices.shape[0]):
+        start = _first_price(prices[row])
+        if prices.shape[1] - start >= max(n_short, n_long) + n_signal:
+            row_macd, row_signal, first = macd_core(prices[row, start:], n_short, n_long, n_signal)
+            macd[row, start + first:] = row_macd
+            signal[row, start + first:] = row_signal
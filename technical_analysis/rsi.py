@@ -6,6 +6,7 @@ from pandas import DataFrame
 
 import numpy as np
 
+from technical_analysis.kernels import rsi_averages
 from tools.synced_list import SyncedList
 from tools.messaging import Message, Listener
 from data_requests import get_data
@@ -15,65 +16,36 @@ def rsi(symbol: str, start: datetime.datetime, end: datetime.datetime, period: i
     """
     Computes the RSI of period <period> for the given stock symbol for all trading days between <start> and <end>,
     inclusive. If <local>=True, assumes that <dir> is a string containing a path to a directory containing stock data.
-    Files in this directory should be .csv's and have filename equal to the stock symbol whose data they are holding.
-    This method assumes that the file <symbol>.csv exists in <dir>, if <local>=True.
+    Files in this directory should be .csv's or .parquet's and have filename equal to the stock symbol whose data they
+    are holding. This method assumes that the file <symbol>.parquet or <symbol>.csv exists in <dir>, if <local>=True.
 
     See tools.pull_data.py for an easy way of storing stock data locally like this
     """
-    df = get_data(symbol, start, end, local=local, dir=dir)
+    df = get_data(symbol, start, end, local=local, dir=dir, columns=["Adj Close"])
     if df is None:
         return None
 
-    df["Gain"] = np.nan
-    df["Loss"] = np.nan
-    # Fill in "Gain" and "Loss" columns
-    for i in range(1, len(df.index)):
-        diff = df["Adj Close"][df.index[i]] - df["Adj Close"][df.index[i - 1]]
-        if diff >= 0:
-            df.loc[df.index[i], "Gain"] = diff
-            df.loc[df.index[i], "Loss"] = 0
-        else:
-            df.loc[df.index[i], "Gain"] = 0
-            # When calculating RSI, we take losses as positive numbers
-            df.loc[df.index[i], "Loss"] = -diff
-
-    # Chop off the first row of the DataFrame, which has no Gain/Loss number
-    df = df[df.index[1]:]
-
-    # Create three empty columns: RSI, Average Gain, Average Loss
-    df["RSI"] = np.nan
-    df["Average Gain"] = np.nan
-    df["Average Loss"] = np.nan
-
-    sum_gain = 0
-    sum_loss = 0
-    for i in range(period):
-        sum_gain += df["Gain"][df.index[i]]
-        sum_loss += df["Loss"][df.index[i]]
-
-    df.loc[df.index[period - 1], "Average Gain"] = sum_gain / 14
-    df.loc[df.index[period - 1], "Average Loss"] = sum_loss / 14
-
-    # The first RSI value is 100 - (100 / (1+ RS)), where RS = (Average Gain / Average Loss) over the first 14 days of
-    # the window
-    df.loc[df.index[period - 1], "RSI"] = 100 - 100 / (
-            1 + (df["Average Gain"][df.index[period - 1]] / df["Average Loss"][df.index[period - 1]]))
-
-    for i in range(period, len(df.index)):
-        df.loc[df.index[i], "Average Gain"] = _exp_average(df["Average Gain"][df.index[i - 1]],
-                                                       df["Gain"][df.index[i]], period)
-        df.loc[df.index[i], "Average Loss"] = _exp_average(df["Average Loss"][df.index[i - 1]],
-                                                       df["Loss"][df.index[i]], period)
-        df.loc[df.index[i], "RSI"] = 100 - 100 / (1 + df["Average Gain"][df.index[i]] / df["Average Loss"][df.index[i]])
-
-    return df.loc[start:end]
-
-
-def _exp_average(previous: float, current: float, period: int) -> float:
-    """
-    Computes the exponential average used in the RSI calculation
-    """
-    return ((period - 1) * previous + current) / period
+    # Work out the gains and losses from the day-to-day differences in price, all at once. The first day has no
+    # previous day to compare against, so it has no gain or loss, and is left out of the result below.
+    prices = df["Adj Close"].to_numpy()
+    diff = np.diff(prices.astype(np.float64))
+    gain = np.where(diff >= 0, diff, 0.0)
+    # When calculating RSI, we take losses as positive numbers
+    loss = np.where(diff < 0, -diff, 0.0)
+
+    # The first average gain and loss are simple averages over the first <period> days, and the first RSI value is
+    # 100 - (100 / (1+ RS)), where RS = (Average Gain / Average Loss). After that, each day's averages are smoothed
+    # from the previous day's.
+    average_gain, average_loss, rsi_values = rsi_averages(gain, loss, period)
+
+    # Only build a DataFrame for the days in our range, from the first one with a gain or loss. The arrays above start
+    # from the second day of <df>, so they're one position behind it.
+    first = max(int(df.index.searchsorted(start)), 1)
+    last = int(df.index.searchsorted(end, side="right"))
+    return DataFrame({"Adj Close": prices[first:last], "Gain": gain[first - 1:last - 1],
+                      "Loss": loss[first - 1:last - 1], "RSI": rsi_values[first - 1:last - 1],
+                      "Average Gain": average_gain[first - 1:last - 1],
+                      "Average Loss": average_loss[first - 1:last - 1]}, index=df.index[first:last])
 
 
 def check_overbought_oversold(symbols: SyncedList, start: datetime.datetime, end: datetime.datetime, period: int, listener: Listener):
@@ -85,19 +57,15 @@ def check_overbought_oversold(symbols: SyncedList, start: datetime.datetime, end
 
         df = rsi(symbol, start, end, period)
         if df is not None:
-            for date in df.index:
-                if df["RSI"][date] >= 80:
-                    msg = Message()
-                    msg.add_line("=========================")
-                    msg.add_line(symbol + " was overbought on " + str(date))
-                    msg.add_line("=========================")
-                    listener.send(msg)
-                elif df["RSI"][date] <= 20:
-                    msg = Message()
-                    msg.add_line("=========================")
-                    msg.add_line(symbol + " was oversold on " + str(date))
-                    msg.add_line("=========================")
-                    listener.send(msg)
+            # Find the overbought and oversold days with one pass over the RSI values, rather than looking each day up
+            rsi_values = df["RSI"].to_numpy()
+            for i in np.flatnonzero((rsi_values >= 80) | (rsi_values <= 20)):
+                state = "overbought" if rsi_values[i] >= 80 else "oversold"
+                msg = Message()
+                msg.add_line("=========================")
+                msg.add_line(symbol + " was " + state + " on " + str(df.index[i]))
+                msg.add_line("=========================")
+                listener.send(msg)
         symbol = symbols.pop()
 
 
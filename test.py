@@ -1,24 +1,42 @@
+import os
+import time
 import requests
 import json
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from typing import TextIO, List
 import datetime as dt
 from matplotlib import style
-import pandas_datareader.data as web
 from datetime import datetime, timedelta
 
+from data_requests import get_data_batch
+
+# orjson parses JSON several times faster than the json module, but it's optional: without it we fall back on json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+How many seconds main reuses the last download of aapl.json for, rather than asking AlphaVantage for it again
+"""
+CACHE_SECONDS = 60
+
 
 def main():
     key = "OSO2MXY1UHSU2NLX"
     prefix = "https://www.alphavantage.co/query"
-    response = requests.get(prefix, params={"apikey": key, "function":"TIME_SERIES_INTRADAY", "symbol":"AAPL", "interval":"60min", "outputsize":"full"});
-    out = open("aapl.json", "w")
-    out.write(response.text)
-    out.close()
-
-    f = open("aapl.json")
-    graph_closing_prices(f, "60min")
+    # Running this again right away would just download the same data, so only make the request if the file from the
+    # last run is missing or stale
+    if not os.path.exists("aapl.json") or time.time() - os.path.getmtime("aapl.json") > CACHE_SECONDS:
+        response = requests.get(prefix, params={"apikey": key, "function":"TIME_SERIES_INTRADAY", "symbol":"AAPL", "interval":"60min", "outputsize":"full"});
+        # Save the bytes exactly as they came, rather than having requests decode them to text only to encode them again
+        with open("aapl.json", "wb") as out:
+            out.write(response.content)
+
+    with open("aapl.json", "rb") as f:
+        graph_closing_prices(f, "60min")
     # TODO: add string parameter that specifies the interval
 
     # f = open("nasdaqtraded.txt")
@@ -30,20 +48,24 @@ def graph_closing_prices(f, interval: str) -> None:
     Given a JSON file of a stock's data, graph the closing prices at
     minute-by-minute intervals
 
-    :param f: JSON file with specific format
+    :param f: JSON file with specific format, opened in binary mode
     :param interval: the interval time at which data points are gathered
     :return: void
     """
 
-    stock_data = json.load(f)
-    date = []
-    value = []
-    for key in stock_data["Time Series " + "(" + interval + ")"]:
-        date.append(key[5:-3])
-        value.append(float(stock_data["Time Series " + "(" + interval + ")"][key]["4. close"]))
-    date.reverse()
+    text = f.read()
+    stock_data = orjson.loads(text) if orjson is not None else json.loads(text)
+    time_series = stock_data["Time Series (" + interval + ")"]
+
+    # Only pull out the closing prices, straight into a float32 array of the right size, rather than turning every
+    # field of every time into a DataFrame of strings first.
+    value = np.fromiter((float(prices["4. close"]) for prices in time_series.values()), dtype=np.float32,
+                        count=len(time_series))
+    # The times come newest first, so flip both columns to plot them in order: the times by reading them in reverse,
+    # and the prices through a reversed view of the array, which doesn't copy it
+    date = [key[5:-3] for key in reversed(time_series)]
+    df = pd.DataFrame({"time": date, "closing_price": value[::-1]})
 
-    df = pd.DataFrame(list(zip(date, value)), columns=["time", "closing_price"])
     df.plot(x="time", y="closing_price")
     plt.gcf().autofmt_xdate()
     plt.title("Graph of Closing Prices for " + stock_data["Meta Data"]["2. Symbol"])
@@ -52,107 +74,45 @@ def graph_closing_prices(f, interval: str) -> None:
 
 def extract_symbols(f: TextIO) -> List[str]:
     """
-    Given a csv file with delimeter "|", extract all the stock symbols
+    Given a csv file with delimeter "|", extract all the stock symbols. NASDAQ symbols that are missing or contain
+    anything other than letters are left out.
 
     :param: file with all the information
-    :return: A list of all the stock symbols
+    :return: A list of all the stock symbols, and a list of all the usable NASDAQ symbols
     """
 
     df = pd.read_csv(f, delimiter="|")
-    return df["Symbol"].tolist(), df["NASDAQ Symbol"].tolist()
-
-def get_data(start, end, symbol):
-    df = web.DataReader(symbol, 'yahoo', start, end)
-    return df
+    # Filter the whole column at once, rather than checking each symbol in a Python loop
+    nasdaq_symbols = df["NASDAQ Symbol"].dropna().astype(str)
+    return df["Symbol"].tolist(), nasdaq_symbols[nasdaq_symbols.str.isalpha()].tolist()
 
-
-def get_max_increase_from_yesterday():
-    """
-    Return the 10 stock that increased the most form past day to today
+def get_extremes_from_yesterday():
     """
-    start = datetime.now() - timedelta(2)
-    end = datetime.now()
-    f = open("nasdaqtraded.txt")
-    stock_symbols, nasdaq_stock_symbols = extract_symbols(f)
+    Return the 100 stocks that increased the most from past day to today, and the 100 that decreased the most, as two
+    dicts mapping each symbol to its increase.
 
-    result = {}
-
-    for i in range(len(nasdaq_stock_symbols)):
-        symbol = nasdaq_stock_symbols[i]
-        if isinstance(symbol, str):
-            if not symbol.isalpha():
-                continue
-        else:
-            continue
-
-        try:
-            df = get_data(start, end, symbol)
-        except:
-            continue
-
-        if len(df['Close'].tolist()) != 2:
-            continue
-        yes, td = df['Close'].tolist()[:]
-
-        inc = (td - yes) / yes
-        if len(result) < 100:
-            result[symbol] = inc
-        else:
-            min = list(result.keys())[0]
-            for key in result:
-                if result[key] < result[min]:
-                    min = key
-            if result[min] > inc:
-                result.pop(min)
-                result[symbol] = inc
-        print(result)
-    return result
-
-def get_min_increase_from_yesterday():
-    """
-    Return the 10 stock that decreased the most form past day to today
+    Both are found in the same pass over the same data, so every symbol's data is only fetched once, and it's fetched
+    by get_data_batch, many symbols to a request.
     """
     start = datetime.now() - timedelta(2)
     end = datetime.now()
     f = open("nasdaqtraded.txt")
     stock_symbols, nasdaq_stock_symbols = extract_symbols(f)
 
-    result = {}
-
-    for i in range(len(nasdaq_stock_symbols)):
-        symbol = nasdaq_stock_symbols[i]
-        if isinstance(symbol, str):
-            if not symbol.isalpha():
-                continue
-        else:
-            continue
-
-        try:
-            df = get_data(start, end, symbol)
-        except:
-            continue
-
-        if len(df['Close'].tolist()) != 2:
-            continue
-        yes, td = df['Close'].tolist()[:]
-
-        inc = (td - yes) / yes
-        if len(result) < 100:
-            result[symbol] = inc
-        else:
-            max = list(result.keys())[0]
-            for key in result:
-                if result[key] > result[max]:
-                    max = key
-            if result[max] > inc:
-                result.pop(max)
-                result[symbol] = inc
-        print(result)
-    return result
+    data = get_data_batch(nasdaq_stock_symbols, start, end)
+
+    # Compare each stock's two most recent closes, however many days the window happened to take in, skipping stocks
+    # with fewer than two. With all of them in one DataFrame, the increases are computed in a single vectorized step,
+    # and the top and bottom 100 are selected by pandas without sorting them all. The closes are made floats explicitly,
+    # since with no stocks at all the columns would otherwise be objects, which nlargest rejects.
+    closes = pd.DataFrame([(symbol, *df['Close'].iloc[-2:]) for symbol, df in data.items() if len(df.index) >= 2],
+                          columns=["symbol", "yes", "td"]).set_index("symbol").astype(float)
+    inc = (closes["td"] - closes["yes"]) / closes["yes"]
+
+    return inc.nlargest(100).to_dict(), inc.nsmallest(100).to_dict()
 
 if __name__ == "__main__":
-    result_max = get_max_increase_from_yesterday()
-    result_min = get_min_increase_from_yesterday()
+    result_max, result_min = get_extremes_from_yesterday()
 
 
     with open('data_pos.json', 'w') as fp:
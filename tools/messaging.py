@@ -1,5 +1,9 @@
+import atexit
+import os
+import queue
+import sys
 import threading
-from typing import List
+from typing import Iterable, List, Optional
 
 
 class Message:
@@ -16,6 +20,8 @@ class Message:
 
     """
 
+    __slots__ = ("_lines",)
+
     def __init__(self):
         """
         Create a new, empty Message.
@@ -28,12 +34,26 @@ class Message:
         """
         self._lines.append(line)
 
+    def add_lines(self, lines: Iterable[str]):
+        """
+        Append each line in <lines> to this Message, in order
+        """
+        self._lines.extend(lines)
+
     def get_lines(self) -> List[str]:
         """
         Return a COPY of this message's contents; a list of all the lines added to this Message since its creation
         """
         return self._lines.copy()
 
+    @property
+    def _lines_view(self) -> List[str]:
+        """
+        This message's contents, WITHOUT copying them. For use by the classes in this module, which only read the lines
+        of a Message once, as soon as it is sent to them.
+        """
+        return self._lines
+
     def reset(self):
         """
         Reset this Message, emptying its contents so that it can be reused
@@ -41,6 +61,14 @@ class Message:
         self._lines = []
 
 
+# Every Listener writes to the same console, so rather than each starting a thread of its own, they all put their text
+# on one queue, written out by one background thread. The thread is started the first time a Listener is made.
+_queue = queue.Queue()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_exit_registered = False
+
+
 class Listener:
     """
     This object exists as a barrier between multiple threads and the console, acting as a go-between so that threads
@@ -48,16 +76,17 @@ class Listener:
     threads through the use of a Message object, which is essentially a wrapper for multiple lines of text that a thread
     wants printed to the screen in a discrete block.
 
-    Attributes:
-        _lock : thread.Lock
-            The Lock that this object uses to ensure orderly access to the console by client threads
+    Sending a Message only puts its text on a queue. A background thread takes messages off the queue one at a time and
+    writes them to the console, so the threads sending Messages never wait on the console. All Listeners share the same
+    queue and thread, so making a new Listener costs next to nothing, and Messages sent to different Listeners don't
+    interweave either.
     """
 
     def __init__(self):
         """
         Create a new Listener, ready for use
         """
-        self._lock = threading.Lock()
+        _start_writer()
 
     def send(self, message: Message):
         """
@@ -66,8 +95,107 @@ class Listener:
 
         This method is thread-safe, meaning that if multiple threads send Messages to one Listener, the messages will
         each be printed in their entirety and without interweaving, in the order in which they made their calls to the
-        Listener
+        Listener. It returns without waiting for the message to be printed.
+        """
+        lines = message._lines_view
+        if lines:
+            # Join the lines now, so the whole message is written with a single call, and so that the sender is free
+            # to reuse <message> as soon as this returns
+            _queue.put("\n".join(lines) + "\n")
+            # A Listener carried into a forked process has no writer there until it sends something
+            if _writer is None:
+                _start_writer()
+
+    def flush(self):
+        """
+        Wait until every Message sent to this Listener, or any other, so far has been printed
+        """
+        _flush_writer()
+
+
+def _start_writer():
+    """
+    Start the background thread that writes queued messages to the console, unless it's already running
+    """
+    global _writer, _exit_registered
+    with _writer_lock:
+        if _writer is not None:
+            return
+
+        _writer = threading.Thread(target=_write, daemon=True)
+        _writer.start()
+        # The writer is a daemon thread, so it won't keep the program running on its own. Make sure it has written
+        # everything it was sent before the program exits.
+        if not _exit_registered:
+            atexit.register(_flush_writer)
+            _exit_registered = True
+
+
+def _flush_writer():
+    """
+    Wait until every queued message has been written, or until the writer thread has died, as it would if writing to
+    the console failed. Registered to run when the program exits.
+    """
+    # Like _queue.join, except that it checks on the writer every so often rather than waiting on it forever
+    with _queue.all_tasks_done:
+        while _queue.unfinished_tasks and _writer is not None and _writer.is_alive():
+            _queue.all_tasks_done.wait(0.1)
+
+
+def _write():
+    """
+    Write queued messages to the console, forever. Run by the background thread that _start_writer starts.
+    """
+    while True:
+        text = _queue.get()
+        sys.stdout.write(text)
+        # Flushing is what actually hits the console, so only do it once we've caught up with the queue
+        if _queue.empty():
+            sys.stdout.flush()
+        _queue.task_done()
+
+
+def _forget_writer():
+    """
+    A forked process doesn't get a copy of the writer thread, and the queue may have been copied mid-operation, so give
+    the new process a queue of its own, and let it start its own writer if it needs one
+    """
+    global _queue, _writer, _writer_lock
+    _queue = queue.Queue()
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+# Only POSIX systems can fork, and only they have register_at_fork
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_writer)
+
+
+class MessageLog:
+    """
+    A stand-in for Listener for work done in another process, which can't share the Listener of the process that
+    started it. Rather than printing the Messages it is sent, a MessageLog collects their lines into one Message, so
+    that they can be handed back and sent to a real Listener as a single block.
+
+    Attributes:
+        _message : Message
+            every line sent to this MessageLog so far, in the order in which they were sent
+    """
+
+    def __init__(self):
+        """
+        Create a new, empty MessageLog
+        """
+        self._message = Message()
+
+    def send(self, message: Message):
+        """
+        Append the lines of the given message to this MessageLog
+        """
+        self._message._lines.extend(message._lines_view)
+
+    def get_message(self) -> Message:
+        """
+        Return a Message containing every line sent to this MessageLog
         """
-        with self._lock:
-            for line in message.get_lines():
-                print(line)
+        return self._message
@@ -1,23 +1,15 @@
-import threading
+import itertools
 from typing import List, Optional
 
 
-
-
-class _Node:
-    """
-    Represents a Node in a linked list, with a value (a string) and a next pointer
-    """
-    def __init__(self, val: str, init_next=None):
-        self.val = val
-        self.next = init_next
-
-
 class SyncedList:
     """
-    A pop-only and thread-safe Stack implemented using a LinkedList. Houses a list of strings, and makes use of a thread
-    Lock so as to allow the list to be shared safely as an input between multiple threads. Provides fast and efficient
-    access to the front of the list thanks to the LinkedList implementation.
+    A pop-only and thread-safe Stack. Houses a list of strings, and hands them out front to back so as to allow the list
+    to be shared safely as an input between multiple threads.
+
+    Rather than guarding the list with a Lock, each call to pop takes the next index from an itertools.count. Advancing
+    a count happens in a single step in C while holding the GIL, so no two threads can ever be given the same index,
+    and threads popping from the list never have to wait on one another.
 
     Works especially well, for example, as a repository for a central list of stock symbols being operated on by
     multiple different threads.
@@ -25,17 +17,10 @@ class SyncedList:
 
     def __init__(self, init: List[str]):
         """
-        Creates a LinkedList copy of <init>
+        Creates a copy of <init>
         """
-        self._lock = threading.Lock()
-        if len(init) >= 1:
-            self._head = _Node(init[0])
-            last = self._head
-
-            for val in init[1:]:
-                node = _Node(val)
-                last.next = node
-                last = node
+        self._items = list(init)
+        self._next = itertools.count()
 
     def pop(self) -> Optional[str]:
         """
@@ -43,30 +28,15 @@ class SyncedList:
 
         This method is thread-safe.
         """
-        with self._lock:
-            if self._head is None:
-                return None
-            else:
-                head = self._head
-                self._head = self._head.next
-                return head.val
+        i = next(self._next)
+        if i < len(self._items):
+            return self._items[i]
+        return None
 
     def __str__(self):
         """
-        Return a string representation of this object. Mimics exactly the String representation of a normal list. That
-        is, returns the contents of the list, comma-delimited and encased in "[...]"
+        Return a string representation of the elements this list was created with. Mimics exactly the String
+        representation of a normal list. That is, returns the contents of the list, comma-delimited and encased in
+        "[...]"
         """
-        rep = "["
-
-        node = self._head
-        while node is not None:
-            if node.next is None:
-                rep += node.val
-            else:
-                rep += node.val + ", "
-
-            node = node.next
-
-        rep += "]"
-
-        return rep
+        return "[" + ", ".join(self._items) + "]"
@@ -14,7 +14,7 @@ class SyncedFile:
         Args:
             file: a path to the file that this object should write to
         """
-        self._file = open(file, "w")
+        self._file = open(file, "w", encoding="utf-8")
         self._lock = threading.Lock()
 
     def save(self, msg: Message):
@@ -26,8 +26,8 @@ class SyncedFile:
         Returns:
             Nothing
         """
+        # Join the lines before taking the lock, so the whole message is written, and then flushed to disk, in one go
+        text = "".join(line + "\n" for line in msg.get_lines())
         with self._lock:
-            lines = msg.get_lines()
-            for line in lines:
-                self._file.write(line + "\n")
+            self._file.write(text)
             self._file.flush()